@@ -9,14 +9,28 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
-import re
-import difflib
+import functools
+from collections import Counter
+
+from refremove import RefRemover, split_names
+from transformpool import TransformPool
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
+DEFAULT_NAMES = 'населення 2001 мова|розподіл за мовою'
+
+
+@functools.lru_cache(maxsize=None)
+def default_remover() -> RefRemover:
+    return RefRemover(split_names(DEFAULT_NAMES))
+
+
+def transform(text: str, remover: RefRemover | None = None) -> tuple[str, Counter]:
+    """Remove the list-defined refs; return the new text and removals per name."""
+    return (remover or default_remover()).remove(text)
+
 
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
@@ -47,8 +61,25 @@ class BasicBot(
         'summary': "Прибирання цитувань 'населення 2001 мова' там, де вони замінені шаблоном",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'names': DEFAULT_NAMES,  # list-defined refs to remove, separated by |
+        'workers': 0,  # transform pages in this many processes
     }
 
+    def setup(self) -> None:
+        """Compile the ref names to remove and start the transform workers."""
+        super().setup()
+        self.remover = RefRemover(split_names(self.opt.names))
+        self.removed = Counter()
+        self.transforms = TransformPool(functools.partial(transform, remover=self.remover), self.opt.workers)
+        self.generator = self.transforms.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Stop the transform workers and report how many refs of each name were removed."""
+        self.transforms.shutdown()
+        for name in sorted(self.remover.names):
+            print(f'{name}: {self.removed[name]}')
+        super().teardown()
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
@@ -65,20 +96,11 @@ class BasicBot(
         # Use your own text or use the default 'Test'
         
         print(self.current_page.extract(lines=2))
-        parsed = wtp.parse(text)
-        templates = parsed.templates
-        for template in templates:
-            if template.normal_name().lower() == "reflist":
-                for argument in template.arguments:
-                    if argument.name == "refs":
-                        pattern = r'<ref name="населення 2001 мова">.*?</ref>'
-                        pattern2 = r'<ref name="розподіл за мовою">.*?</ref>'
-                        argument.value = re.sub(pattern, '', argument.value)
-                        argument.value = re.sub(pattern2, '', argument.value)
-                        break
-                break
-        
-        text = str(parsed)
+        text, removed = self.transforms.result(self.current_page)
+        self.removed.update(removed)
+        if not removed:
+            return
+
         self.put_current(text, summary=self.opt.summary)
 
 def main(*args: str) -> None:
@@ -105,10 +127,12 @@ def main(*args: str) -> None:
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text'):
+        if option in ('summary', 'text', 'names'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'workers':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
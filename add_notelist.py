@@ -59,12 +59,68 @@ from pywikibot.bot import (
     SingleSiteBot,
 )
 import wikitextparser as wtp
-import re
+from collections import Counter
+
+from pagelayout import PageLayout
+from pagemodel import Gate
+from transformpool import TransformPool
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
+# pages without this are not parsed at all
+GATE = Gate(r'\{\{\s*(?:efn|notetag)')
+
+
+def insert_notelist(text: str, template_names: list[str]) -> tuple[str, Counter]:
+    """
+    Add a notes section if a note template has no list for it.
+
+    :param template_names: names of all templates of the text, lowercase
+    :return: the new text and the list added
+    """
+    note_mapping = {
+        "efn": "notelist",
+        "efn-ua": "notelist-ua",
+        "efn-lr": "notelist-lr",
+        "efn-ur": "notelist-ur",
+        "efn-lg": "notelist-lg",
+        "notetag": "notefoot"
+    }
+    
+    
+    for template, notelist in note_mapping.items():
+        if template in template_names and notelist not in template_names:
+            insertion_text = f"== Коментарі ==\n{{{{{notelist}}}}}"
+            layout = PageLayout(text)
+            pos = layout.reflist_end
+            if pos is not None:
+                text = text[:pos] + "\n" + insertion_text + text[pos:]
+            else:
+                pos = layout.footer_start
+                text = text[:pos] + insertion_text + "\n" + text[pos:]
+            return text, Counter({notelist: 1})
+    return text, Counter()
+
+
+def transform(text: str) -> tuple[str, Counter]:
+    """Add a notes section where {{efn}}-like notes have no list; return the new text and the list added."""
+    if not GATE.match(text):
+        return text, Counter()
+    parsed = wtp.parse(text)
+    #tags = parsed.get_tags(name="ref")
+    #groups = set()
+    #for tag in tags:
+    #    groups.add(tag.get_attr("group"))
+    #if any(group in groups for group in ["ком"]): # "lower-alpha", "upper-alpha", "lower-roman", "upper-roman", "lower-greek", "note", 
+    #    print(groups)
+    #    input()
+    
+    templates = parsed.templates
+    template_names = [template.name.strip().lower() for template in templates]
+    return insert_notelist(text, template_names)
+
 
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
@@ -95,8 +151,22 @@ class BasicBot(
         'summary': "Додано розділ коментарів",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'workers': 0,  # transform pages in this many processes
     }
 
+    def setup(self) -> None:
+        """Start the transform workers."""
+        super().setup()
+        self.generator = GATE.filter(self.generator)
+        self.transforms = TransformPool(transform, self.opt.workers)
+        self.generator = self.transforms.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Stop the transform workers."""
+        self.transforms.shutdown()
+        GATE.report()
+        super().teardown()
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
@@ -115,57 +185,8 @@ class BasicBot(
         # Use your own text or use the default 'Test'
         
         print(self.current_page.extract(lines=2))
-        parsed = wtp.parse(text)
-        #tags = parsed.get_tags(name="ref")
-        #groups = set()
-        #for tag in tags:
-        #    groups.add(tag.get_attr("group"))
-        #if any(group in groups for group in ["ком"]): # "lower-alpha", "upper-alpha", "lower-roman", "upper-roman", "lower-greek", "note", 
-        #    print(groups)
-        #    input()
-        
-        templates = parsed.templates
-        template_names = [template.name.strip().lower() for template in templates]
-
-        note_mapping = {
-            "efn": "notelist",
-            "efn-ua": "notelist-ua",
-            "efn-lr": "notelist-lr",
-            "efn-ur": "notelist-ur",
-            "efn-lg": "notelist-lg",
-            "notetag": "notefoot"
-        }
-        
-        
-        def insert_before_categories(text, insertion):
-            categories_start = len(text)
-            for tag in ["[[Категорія:", "{{DEFAULTSORT:", "{{Authority control", "{{Бібліоінформація", "{{Нормативний контроль"]:
-                pos = text.find(tag)
-                if pos != -1 and pos < categories_start:
-                    categories_start = pos
-
-            return text[:categories_start] + insertion + "\n" + text[categories_start:]
-            
-        def insert_after_reflist(text, insertion):
-            reflist_tags = ["{{reflist}}", "{{reflist|2}}", "{{примітки}}", "<references />", "<references/>"]
-            text_lower = text.lower()
-            
-            for tag in reflist_tags:
-                pos = text_lower.find(tag)
-                if pos != -1:
-                    insert_pos = pos + len(tag)
-                    return text[:insert_pos] + "\n" + insertion + text[insert_pos:]
-            
-            return insert_before_categories(text, insertion)
-
-        for template, notelist in note_mapping.items():
-            if template in template_names and notelist not in template_names:
-                insertion_text = f"== Коментарі ==\n{{{{{notelist}}}}}"
-                text = insert_after_reflist(text, insertion_text)
-                break
+        text, _ = self.transforms.result(self.current_page)
 
-        
-        
         # if summary option is None, it takes the default i18n summary from
         # i18n subdirectory with summary_key as summary key.
         self.put_current(text, summary=self.opt.summary)
@@ -199,6 +220,8 @@ def main(*args: str) -> None:
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'workers':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark of refscan.get_ref_tags against wikitextparser's get_tags.
+
+Usage: python bench_refscan.py [file.wiki ...]
+
+Without arguments a synthetic article with 600 refs is used. Each text is
+scanned with both methods and the names and contents of the found tags are
+compared.
+"""
+from __future__ import annotations
+
+import sys
+import timeit
+
+import wikitextparser as wtp
+
+from refscan import get_ref_tags
+
+
+def synthetic_article(refs: int = 600) -> str:
+    parts = ['{{Картка:Населений пункт|назва=Тест|область=Київська область}}\n']
+    for i in range(refs):
+        parts.append(f"== Розділ {i} ==\n'''Текст''' [[посилання|{i}]] {{{{нп|A|B|en|C}}}} " * 3)
+        if i % 3 == 0:
+            parts.append(f'<ref name="r{i}">{{{{cite web|url=http://example.org/{i}|title=T{i}}}}}</ref>\n')
+        elif i % 3 == 1:
+            parts.append(f'<ref name=r{i - 1} />\n<!-- <ref name="c{i}">x</ref> -->\n')
+        else:
+            parts.append(f'<ref group="ком">Коментар {i}</ref>\n')
+    parts.append('== Примітки ==\n{{reflist}}\n[[Категорія:Тест]]\n')
+    return ''.join(parts)
+
+
+def wtp_tags(text):
+    return wtp.parse(text).get_tags(name='ref')
+
+
+def bench(title: str, text: str, number: int = 5) -> None:
+    fast = [(tag.attrs.get('name'), tag.contents) for tag in get_ref_tags(text)]
+    slow = [(tag.attrs.get('name'), tag.contents) for tag in wtp_tags(text)]
+    t_wtp = timeit.timeit(lambda: wtp_tags(text), number=number) / number
+    t_scan = timeit.timeit(lambda: get_ref_tags(text), number=number) / number
+    print(f'{title}: {len(text)} chars, {len(fast)} refs, '
+          f'wtp {t_wtp * 1000:.1f} ms, refscan {t_scan * 1000:.2f} ms, '
+          f'x{t_wtp / t_scan:.0f}, same result: {fast == slow}')
+
+
+def main(*args: str) -> None:
+    if not args:
+        bench('synthetic', synthetic_article())
+    for path in args:
+        with open(path, encoding='utf-8') as f:
+            bench(path, f.read())
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
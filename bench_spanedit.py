@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark of span edits against repeated text.replace in fixrefs.py.
+
+Usage: python bench_spanedit.py [refs] [conflicts]
+
+Builds a synthetic article with the given number of refs, of which
+`conflicts` names have a second, different definition, and resolves every
+conflict in favour of the first definition both ways.
+"""
+from __future__ import annotations
+
+import sys
+import timeit
+
+from refscan import get_ref_tags
+from spanedit import SpanEdits
+
+
+def synthetic_article(refs: int, conflicts: int) -> str:
+    parts = []
+    for i in range(refs):
+        parts.append(f"Речення {i} з [[посиланням]] і {{{{шаблоном|{i}}}}}. " * 20)
+        parts.append(f'<ref name="r{i}">{{{{cite web|url=http://example.org/{i}|title=T{i}}}}}</ref>\n')
+    for i in range(conflicts):
+        parts.append(f'Ще текст. <ref name="r{i}">{{{{cite web|url=http://example.org/{i}|title=Інша {i}}}}}</ref>\n')
+    return ''.join(parts)
+
+
+def conflicts_of(tags):
+    first = {}
+    for tag in tags:
+        name = tag.attrs.get('name')
+        if name in first and tag.contents != first[name].contents:
+            yield tag
+        else:
+            first.setdefault(name, tag)
+
+
+def with_replace(text, tags):
+    for tag in conflicts_of(tags):
+        text = text.replace(f'>{tag.contents}</ref', '/')
+    return text
+
+
+def with_spans(text, tags):
+    edits = SpanEdits(text)
+    for tag in conflicts_of(tags):
+        opening = tag.string[:tag.contents_span[0] - tag.span[0]]
+        edits.replace(*tag.span, opening[:-1] + '/>')
+    return edits.apply()
+
+
+def main(refs: int = 300, conflicts: int = 60) -> None:
+    text = synthetic_article(refs, conflicts)
+    tags = get_ref_tags(text)
+    number = 20
+    t_replace = timeit.timeit(lambda: with_replace(text, tags), number=number) / number
+    t_spans = timeit.timeit(lambda: with_spans(text, tags), number=number) / number
+    print(f'{len(text)} chars, {refs} refs, {conflicts} conflicts: '
+          f'replace {t_replace * 1000:.2f} ms, spans {t_spans * 1000:.2f} ms, '
+          f'x{t_replace / t_spans:.1f}, same result: {with_replace(text, tags) == with_spans(text, tags)}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Streaming reader of MediaWiki XML dumps (*-pages-articles.xml[.bz2]).
+
+The dump is decompressed on the fly and parsed with iterparse; every page
+element is cleared and dropped from the root element once it is read, so
+memory use does not grow with the size of the dump.
+"""
+from __future__ import annotations
+
+import bz2
+import re
+import xml.etree.ElementTree as ET
+from typing import NamedTuple
+
+
+class DumpPage(NamedTuple):
+    ns: int
+    title: str
+    revid: int
+    text: str
+
+
+def _local(tag: str) -> str:
+    """Strip the export namespace, {http://www.mediawiki.org/xml/export-0.11/}."""
+    return tag.rpartition('}')[2]
+
+
+def iter_pages(path: str, namespaces=(0,)):
+    """
+    Yield DumpPage for every page of the dump in the given namespaces.
+
+    Redirects are skipped. Pass namespaces=None to get all pages.
+    """
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rb') as f:
+        root = None
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem  # <mediawiki>, which would keep every cleared page
+                continue
+            if _local(elem.tag) != 'page':
+                continue
+            fields = {}
+            redirect = False
+            for child in elem:
+                name = _local(child.tag)
+                if name in ('title', 'ns'):
+                    fields[name] = child.text or ''
+                elif name == 'redirect':
+                    redirect = True
+                elif name == 'revision':
+                    for rev_child in child:
+                        rev_name = _local(rev_child.tag)
+                        if rev_name in ('id', 'text'):
+                            fields[rev_name] = rev_child.text or ''
+            elem.clear()
+            root.clear()
+            ns = int(fields.get('ns', 0))
+            if redirect or (namespaces is not None and ns not in namespaces):
+                continue
+            yield DumpPage(ns, fields.get('title', ''), int(fields.get('id') or 0), fields.get('text', ''))
+
+
+def dump_lang(path: str) -> str:
+    """Language code from the dump file name, e.g. 'en' for enwiki-latest-...; '' if unknown."""
+    match = re.match(r'([a-z_-]+?)wiki-', path.replace('\\', '/').rpartition('/')[2])
+    return match[1].replace('_', '-') if match else ''
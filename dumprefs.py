@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Offline index of named refs built from XML dumps, for transrefs.py and
+transrefs2.py.
+
+Build or extend the index (one dump per language, any number of them):
+
+    python dumprefs.py enwiki-latest-pages-articles.xml.bz2 [refindex.sqlite]
+
+Then run the bots with -refindex:refindex.sqlite. A foreign page found in
+the index is taken from it without any request to that wiki; only pages
+missing from the index are downloaded. The index reflects the dump date,
+so refs added to a foreign article after the dump are not seen.
+"""
+from __future__ import annotations
+
+import sqlite3
+import sys
+import threading
+
+from dumpreader import dump_lang, iter_pages
+from refscan import extract_named_refs
+
+
+class RefIndex:
+
+    """SQLite index of (lang, title, ref name) -> ref tag string."""
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()  # shared by the fetch threads of transrefs2.py
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' lang TEXT, title TEXT, revid INTEGER, PRIMARY KEY (lang, title));'
+            'CREATE TABLE IF NOT EXISTS refs ('
+            ' lang TEXT, title TEXT, name TEXT, ref TEXT,'
+            ' PRIMARY KEY (lang, title, name)) WITHOUT ROWID;')
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, lang: str, title: str) -> dict[str, str] | None:
+        """Return named refs of the page, or None if the page is not indexed."""
+        with self._lock:
+            if self._conn.execute('SELECT 1 FROM pages WHERE lang = ? AND title = ?',
+                                  (lang, title)).fetchone() is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(self._conn.execute(
+                'SELECT name, ref FROM refs WHERE lang = ? AND title = ?', (lang, title)))
+
+    def build(self, dump_path: str, lang: str, batch: int = 1000) -> int:
+        """Index all articles of the dump; return the number of pages."""
+        count = 0
+        cursor = self._conn.cursor()
+        cursor.execute('DELETE FROM refs WHERE lang = ?', (lang,))
+        cursor.execute('DELETE FROM pages WHERE lang = ?', (lang,))
+        for page in iter_pages(dump_path):
+            cursor.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)',
+                           (lang, page.title, page.revid))
+            cursor.executemany('INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?)',
+                               ((lang, page.title, name, ref)
+                                for name, ref in extract_named_refs(page.text).items()))
+            count += 1
+            if count % batch == 0:
+                self._conn.commit()
+                print(f'{count} pages', end='\r')
+        self._conn.commit()
+        return count
+
+    def close(self) -> None:
+        print(f'Ref index: {self.hits} hits, {self.misses} misses')
+        self._conn.close()
+
+
+def main(*args: str) -> None:
+    if not args:
+        print(__doc__)
+        return
+    dump_path = args[0]
+    index_path = args[1] if len(args) > 1 else 'refindex.sqlite'
+    lang = dump_lang(dump_path)
+    if not lang:
+        lang = input('Language code of the dump: ').strip()
+    index = RefIndex(index_path)
+    count = index.build(dump_path, lang)
+    print(f'Indexed {count} {lang} pages into {index_path}')
+    index.close()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Run the fix of a bot over a local XML dump instead of the live wiki.
+
+    python dumprun.py SCRIPT DUMP [PATCHES] [-workers:N] [-limit:N]
+
+SCRIPT is any of langjp, rubook, tracklist_fix, yar-prim, add_notelist and
+2001, i.e. a script with a transform(text) -> (new text, Counter) function
+that its BasicBot.treat_page also uses. The dump (ukwiki-...-pages-articles
+.xml.bz2) is decompressed and parsed as a stream; pages are sent in batches
+to a process pool, one worker per core by default. Every page the fix would
+change is written to PATCHES (default SCRIPT.patches.jsonl, .bz2 is
+compressed) as one JSON line with title, revid (the dump revision the new
+text is based on), text and changes. Nothing is sent to the wiki.
+"""
+from __future__ import annotations
+
+import bz2
+import importlib
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from dumpreader import iter_pages
+from transformpool import batches
+
+
+def transform_batch(script: str, pages) -> list[tuple[str, int, str, dict]]:
+    """Run the transform of the script over a batch of DumpPage; return the changed pages."""
+    transform = importlib.import_module(script).transform
+    patches = []
+    for page in pages:
+        text, changes = transform(page.text)
+        if text != page.text:
+            patches.append((page.title, page.revid, text, dict(changes)))
+    return patches
+
+
+def iter_patches(script: str, pages, workers: int = 0, batch: int = 64):
+    """
+    Yield (title, revid, new text, changes) for every page the script changes, in dump order.
+
+    At most 2 batches per worker are in flight, so the dump is read only as
+    fast as the workers go.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in batches(pages, batch):
+            pending.append(pool.submit(transform_batch, script, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(*args: str) -> None:
+    positional = [arg for arg in args if not arg.startswith('-')]
+    options = dict(arg[1:].partition(':')[::2] for arg in args if arg.startswith('-'))
+    if len(positional) < 2:
+        print(__doc__)
+        return
+    script, dump_path = positional[:2]
+    script = script.removesuffix('.py')
+    out_path = positional[2] if len(positional) > 2 else f'{script}.patches.jsonl'
+    workers = int(options.get('workers') or 0)
+    scanned = 0
+
+    def counted(pages):
+        nonlocal scanned
+        for page in pages:
+            scanned += 1
+            yield page
+
+    pages = counted(iter_pages(dump_path))
+    if options.get('limit'):
+        pages = islice(pages, int(options['limit']))
+
+    importlib.import_module(script)  # fail early on a wrong name
+    opener = bz2.open if out_path.endswith('.bz2') else open
+    changes = Counter()
+    count = 0
+    started = time.time()
+    with opener(out_path, 'wt', encoding='utf-8') as f:
+        for title, revid, text, page_changes in iter_patches(script, pages, workers):
+            f.write(json.dumps({'title': title, 'revid': revid, 'text': text, 'changes': page_changes},
+                               ensure_ascii=False) + '\n')
+            changes.update(page_changes)
+            count += 1
+            if count % 100 == 0:
+                print(f'{count} pages changed', end='\r')
+    print(f'{count} of {scanned} pages changed in {time.time() - started:.0f} s, written to {out_path}')
+    for name, number in changes.most_common():
+        print(f'{name}: {number}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
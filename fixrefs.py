@@ -12,11 +12,57 @@ from pywikibot.bot import (
 import wikitextparser as wtp
 import re
 import difflib
+import functools
+import hashlib
+
+from prefetch import Prefetcher
+from refscan import get_ref_tags
+from spanedit import OverlappingEdit, SpanEdits
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
+TRAILING_PUNCTUATION = ' .,;:'
+
+
+def canonical_form(contents):
+    """
+    Return ref contents with differences that do not matter removed.
+
+    Whitespace outside templates is collapsed, trailing punctuation dropped,
+    and every template is rewritten with the first letter of its name
+    lowercased (MediaWiki ignores its case only), named parameters stripped
+    and sorted and empty ones left out, so {{cite web|url=a|title=b}} and
+    {{Cite web | title = b | url = a }}. give the same result. Parameter
+    names keep their case, and of a repeated name only the last value counts,
+    as in MediaWiki. Positional parameters are kept as they are: whitespace
+    in them matters.
+    """
+    parsed = wtp.parse(contents)
+    parts = []
+    pos = 0
+    for template in parsed.templates:
+        if template.nesting_level != 1:
+            continue  # handled inside the values of the outer template
+        start, end = template.span
+        parts.append(re.sub(r'\s+', ' ', contents[pos:start]))
+        name = ' '.join(template.name.replace('_', ' ').split())
+        name = name[:1].lower() + name[1:]
+        positional = [argument.value for argument in template.arguments if argument.positional]
+        named = sorted({argument.name.strip(): canonical_form(argument.value)
+                        for argument in template.arguments if not argument.positional}.items())
+        parts.append('{{' + '|'.join([name, *positional, *(f'{key}={value}' for key, value in named if value)]) + '}}')
+        pos = end
+    parts.append(re.sub(r'\s+', ' ', contents[pos:]))
+    return ''.join(parts).strip().rstrip(TRAILING_PUNCTUATION)
+
+
+@functools.lru_cache(maxsize=4096)
+def content_hash(contents):
+    """Hash of the canonical form of ref contents."""
+    return hashlib.sha1(canonical_form(contents).encode()).hexdigest()
+
 
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
@@ -47,8 +93,75 @@ class BasicBot(
         'summary': "Виправлення дублювання цитувань",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'prefetch': 0,  # prepare this many next pages in background
+        'auto': False,  # only resolve trivial duplicates, skip real conflicts
     }
 
+    def setup(self) -> None:
+        """Start preparing pages in background."""
+        super().setup()
+        self.prefetcher = Prefetcher(self.prepare_page, self.opt.prefetch)
+        self.generator = self.prefetcher.wrap(self.generator)
+
+    def teardown(self) -> None:
+        self.prefetcher.shutdown()
+        super().teardown()
+
+    @staticmethod
+    def prepare_page(page):
+        """
+        Download and analyse the page; runs in background with -prefetch.
+
+        :return: (page extract, ref tags), or None if the page is exempt
+        """
+        text = page.text
+        parsed = wtp.parse(text)
+        
+        for template in parsed.templates:
+            if template.name.strip().lower() == 'bots' or template.name.strip().lower() == 'nobots': return None
+
+        return page.extract(lines=2), get_ref_tags(text)
+
+    @staticmethod
+    def collapse(edits, tags) -> None:
+        """Record turning the tags into <ref name=... /> without contents."""
+        for tag in tags:
+            start, end = tag.span
+            opening = tag.string[:tag.contents_span[0] - start]
+            try:
+                edits.replace(start, end, opening[:-1] + "/>")
+            except OverlappingEdit as e:
+                print(f'Skipping {tag}: {e}')
+
+    @staticmethod
+    def choose_variant(name, variants):
+        """
+        Show all variants of a ref name at once and ask which one to keep.
+
+        :param variants: lists of tags, one list per variant
+        :return: index of the chosen variant, or None to skip the name
+        """
+        print(f'Tag conflict! {name}: {len(variants)} variants')
+        for i, variant in enumerate(variants, 1):
+            print(f'Tag {i} ({len(variant)}x):\n {variant[0]}')
+        print("Pick one: (s - skip, d - diff)")
+
+        while True:
+            tag_chosen = input().lower()
+            if tag_chosen.isdigit() and 1 <= int(tag_chosen) <= len(variants):
+                return int(tag_chosen) - 1
+            if tag_chosen == "s":
+                return None
+            if tag_chosen == "d":
+                l1 = variants[0][0].contents
+                for i, variant in enumerate(variants[1:], 2):
+                    print(f'--- 1 / {i}')
+                    difference = difflib.Differ()
+                    for line in difference.compare(l1.splitlines(keepends=True), variant[0].contents.splitlines(keepends=True)):
+                        print(" ")
+                        print(line, end="")
+                    print()
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
@@ -64,54 +177,47 @@ class BasicBot(
         # Retrieve your private option
         # Use your own text or use the default 'Test'
         
-        print(self.current_page.extract(lines=2))
-        parsed = wtp.parse(text)
+        prepared = self.prefetcher.result(self.current_page)
+        if prepared is None:
+            return None # don't do anything if the page is exempt
+        extract, tags = prepared
+        print(extract)
         
-        for template in parsed.templates:
-            if template.name.strip().lower() == 'bots' or template.name.strip().lower() == 'nobots': return None # don't do anything if the page is exempt
+        # Resolutions are recorded as span edits against the original text
+        # and applied in one pass at the end.
+        edits = SpanEdits(text)
+        auto_resolved = 0
+        skipped = 0
 
-        
-        tags = parsed.get_tags(name="ref")
-        tags_dict = {}
+        # All instances of a name grouped by the canonical form of their
+        # contents, in document order: name: {content hash: [tags]}
+        clusters = {}
         for tag in tags:
-            if "name" in tag.attrs:
-                if tag.attrs["name"] in tags_dict:
-                    existing_tag = tags_dict[tag.attrs["name"]]
-                    # Only trigger conflict resolution if both tags are non-empty
-                    if len(tag.contents) == 0 or len(existing_tag.contents) == 0:
-                        continue
-                    if tag.contents == existing_tag.contents:
-                        continue
-                    print("Tag conflict!")
-                    tag1 = existing_tag
-                    tag2 = tag
-                    print(f'Tag 1:\n {tag1}')
-                    print(f'Tag 2:\n {tag2}')
-                    
-                    l1 = tag1.contents
-                    l2 = tag2.contents
-                    
-                    print("Pick one: (3 - skip, 4 - diff)")
-                    
-                    tag_chosen = "0"
-                    while tag_chosen not in ["1", "2", "3", "4"]:
-                        tag_chosen = input()
-                        if tag_chosen == "1":
-                            text = text.replace(f'>{l2}</ref', '/')
-                        elif tag_chosen == "2":
-                            text = text.replace(f'>{l1}</ref', '/')
-                            tags_dict[tag1.attrs["name"]] = tag2
-                        elif tag_chosen == "3":
-                            break
-                        elif tag_chosen == "4":
-                            difference = difflib.Differ()
-                            for line in difference.compare(l1.splitlines(keepends=True), l2.splitlines(keepends=True)):
-                                print(" ")
-                                print(line, end="")
-                else:
-                    # Only add non-empty tags to the dictionary
-                    if len(tag.contents) > 0:
-                        tags_dict[tag.attrs["name"]] = tag
+            if "name" in tag.attrs and len(tag.contents) > 0:
+                clusters.setdefault(tag.attrs["name"], {}).setdefault(content_hash(tag.contents), []).append(tag)
+
+        for name, variants in clusters.items():
+            variants = list(variants.values())
+            if len(variants) == 1:
+                # same reference, possibly written differently; keep the first one
+                trivial = [tag for tag in variants[0][1:] if tag.contents != variants[0][0].contents]
+                self.collapse(edits, trivial)
+                auto_resolved += len(trivial)
+                continue
+            if self.opt.auto:
+                skipped += 1
+                continue
+            chosen = self.choose_variant(name, variants)
+            if chosen is None:
+                continue
+            # keep the first instance of the chosen variant, all other
+            # instances of the name become <ref name=... />
+            keep = variants[chosen][0]
+            self.collapse(edits, [tag for variant in variants for tag in variant if tag is not keep])
+
+        text = edits.apply()
+        if auto_resolved or skipped:
+            print(f'{auto_resolved} trivial duplicates resolved automatically, {skipped} conflicts skipped')
          
         # if summary option is None, it takes the default i18n summary from
         # i18n subdirectory with summary_key as summary key.
@@ -146,6 +252,8 @@ def main(*args: str) -> None:
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'prefetch':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
@@ -12,12 +12,142 @@ from pywikibot.bot import (
 import wikitextparser as wtp
 import re
 import difflib
+import itertools
+
+from prefetch import Prefetcher
+from refscan import extract_named_refs, get_ref_tags
+from reviewqueue import ReviewQueue, accepted_entries, apply_entries
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
+class HistoryRefs:
+
+    """
+    Named refs in the revisions of one page, memoized by the sha1 of the text.
+
+    A text that occurs in several revisions (vandalism and its revert) is
+    downloaded and parsed only once.
+    """
+
+    def __init__(self, page, verbose: bool = True) -> None:
+        self.page = page
+        self.verbose = verbose
+        self.by_sha1 = {}  # sha1 of revision text: (revid, named refs)
+        self.parses_done = 0
+        self.parses_saved = 0
+
+    @staticmethod
+    def content_key(revision):
+        """Key of the revision text: its sha1, or the revid if it is hidden."""
+        return revision.sha1 or revision.revid
+
+    def revision_refs(self, revision):
+        """
+        Return named refs of a revision, memoized by the sha1 of its text.
+
+        The text is downloaded only if no revision with the same sha1 has
+        been parsed for this page yet.
+        """
+        key = self.content_key(revision)
+        if key in self.by_sha1:
+            revid, refs = self.by_sha1[key]
+            if revid != revision.revid:
+                self.parses_saved += 1
+            return refs
+        if self.verbose:
+            print(f'Looking through {revision.comment} by {revision.user}')
+        content = None
+        try:
+            content = self.page.get_revision(revision.revid, content=True).text
+            refs = extract_named_refs(content)
+        except Exception as e:
+            print(e)
+            print("-" * 80)
+            print("Content")
+            print("-" * 80)
+            print(content)
+            print("-" * 80)
+            refs = {}
+        self.parses_done += 1
+        self.by_sha1[key] = (revision.revid, refs)
+        return refs
+
+    def iter_revisions(self):
+        """
+        Yield (revision, named refs) for the page history, newest first.
+
+        Revisions are listed with their sha1 and without text. Texts are
+        downloaded in batches of 50, each distinct text once; a revision
+        whose text already occurred (a revert) is skipped, as its refs have
+        already been offered.
+        """
+        revisions = list(self.page.revisions(content=False))
+        for start in range(0, len(revisions), 50):
+            batch = []
+            batch_keys = set()
+            for revision in revisions[start:start + 50]:
+                key = self.content_key(revision)
+                if key in self.by_sha1 or key in batch_keys:
+                    self.parses_saved += 1
+                    continue
+                batch_keys.add(key)
+                batch.append(revision)
+            if batch:
+                self.page.site.loadrevisions(self.page, content=True, revids=[revision.revid for revision in batch])
+            for revision in batch:
+                yield revision, self.revision_refs(revision)
+
+    def find_bisect(self, names):
+        """
+        Find the newest revision where each of the named refs had contents.
+
+        Only revision metadata is listed; texts are downloaded for the probed
+        revisions. For every name the search gallops back from the current
+        revision (1, 2, 4, 8... revisions ago) until the ref has contents,
+        then bisects between the last two probes, so O(log n) revisions are
+        downloaded instead of the whole history. This assumes the contents
+        were lost once and not restored since; a ref that had contents only
+        for a few revisions between two probes can be missed.
+
+        :return: {name: (revision, ref tag string)} for the names found
+        """
+        revisions = list(self.page.revisions(content=False))  # newest first
+        downloaded = 0
+
+        def refs_at(i):
+            nonlocal downloaded
+            revision = revisions[i]
+            if self.content_key(revision) not in self.by_sha1:
+                downloaded += 1
+            return self.revision_refs(revision)
+
+        found = {}
+        for name in names:
+            newer, older = 0, 1  # revisions[0] is the current one, without contents
+            while older < len(revisions) and name not in refs_at(older):
+                newer, older = older, older * 2
+            if older >= len(revisions):
+                older = len(revisions) - 1
+                if older <= newer or name not in refs_at(older):
+                    if self.verbose:
+                        print(f'{name} not found in history')
+                    continue
+            # revisions[older] has contents for the name, revisions[newer] has not
+            while older - newer > 1:
+                middle = (newer + older) // 2
+                if name in refs_at(middle):
+                    older = middle
+                else:
+                    newer = middle
+            found[name] = (revisions[older], refs_at(older)[name])
+        if self.verbose:
+            print(f'Downloaded {downloaded} of {len(revisions)} revisions')
+        return found
+
+
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
@@ -37,15 +167,89 @@ class BasicBot(
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the 
         'tlang': 'en',
+        'bisect': False,  # binary search over history instead of a full scan
+        'collect': '',  # write candidates to this review queue instead of asking
+        'apply': '',  # save the substitutions accepted in this review queue
+        'prefetch': 0,  # prepare this many next pages in background
     }
 
-    def treat_page(self) -> None:
-        """Load the given page, do some changes, and save it."""
-        text = self.current_page.text    
-        summary = "Підстановка цитувань з попередньої версії статті"
+    parses_done = 0
+    parses_saved = 0
+    queue = None
+
+    def setup(self) -> None:
+        """Open the review queue and start preparing pages in background."""
+        super().setup()
+        if self.opt.collect:
+            self.queue = ReviewQueue(self.opt.collect)
+        if self.opt.apply:
+            self.reviewed = accepted_entries(self.opt.apply)
+        else:
+            self.prefetcher = Prefetcher(self.prepare_page, self.opt.prefetch)
+            self.generator = self.prefetcher.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Report how many parses the sha1 deduplication saved."""
+        if not self.opt.apply:
+            self.prefetcher.shutdown()
+        print(f'Parsed {self.parses_done} revisions, {self.parses_saved} parses saved by sha1')
+        if self.queue is not None:
+            self.queue.close()
+            print(f'{self.queue.count} candidates written to {self.opt.collect}')
+        super().teardown()
+
+    def summary_with_revs(self, summary, revs_taken):
+        """Add links to the revisions the refs were taken from to the summary."""
+        summary += " (З правок: "
+        for id, user in revs_taken.items():
+            summary += f"{user}: https://uk.wikipedia.org/w/index.php?title={self.current_page.title()}&oldid={id} ;"
+        summary += ")"
+        return summary
+
+    def apply_reviewed(self) -> None:
+        """Save the substitutions accepted for the current page."""
+        entries = self.reviewed.get(self.current_page.title(), [])
+        if not entries:
+            return
+        if self.current_page.latest_revision_id != entries[0]['revid']:
+            print(f'{self.current_page.title()} changed since collection, skipping')
+            return
+        text, applied = apply_entries(self.current_page.text, entries)
+        if not applied:
+            print(f'{self.current_page.title()}: no accepted target left in the text, skipping')
+            return
+        # a queue collected by transrefs.py has lang/title sources instead
+        revs_taken = {str(entry['source']['revid']): entry['source'].get('user', '')
+                      for entry in applied if entry['source'].get('revid')}
+        summary = self.summary_with_revs(self.opt.summary, revs_taken) if revs_taken else self.opt.summary
+        self.put_current(text, summary=summary)
+
+    def collect_candidates(self, empty_tags, found) -> None:
+        """Write every distinct candidate for the empty refs to the review queue."""
+        seen = set()
+        for revision, key, value in found:
+            if (key, value) in seen:
+                continue
+            seen.add((key, value))
+            self.queue.add(self.current_page, key, empty_tags[key], value,
+                           {'revid': revision.revid, 'user': str(revision.user)})
+
+    def prepare_page(self, page):
+        """
+        Find the empty refs of the page and look for them in its history.
+
+        Runs in background with -prefetch, so it must not ask anything. The
+        linear scan of the history stops once every empty ref has a
+        candidate; the rest of it is scanned later only if needed.
+
+        :return: (empty_tags, history, candidates), where candidates is an
+            iterator of (revision, ref name, ref tag string)
+        """
+        text = page.text
+        history = HistoryRefs(page, verbose=not self.opt.prefetch)
         
         parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
+        tags = get_ref_tags(text)
         tags_dict = {} # only ref tags
         empty_tags = {} # all tags; name (str): stringified tag/template (str)
         
@@ -74,63 +278,65 @@ class BasicBot(
                 if name not in tags_dict:
                     empty_tags[name] = str(template)
 
-        if len(empty_tags):
-            print(empty_tags)
-            tags_replaced = 0
-            stop_search = False
-            revs_taken = {}
+        if not len(empty_tags):
+            return empty_tags, history, iter(())
+        if self.opt.bisect:
+            found = history.find_bisect(list(empty_tags))
+            return empty_tags, history, iter([(revision, key, value) for key, (revision, value) in found.items()])
 
-            for revision in self.current_page.revisions(content=True):
-                
-                if stop_search:
+        scan = ((revision, key, value) for revision, refs in history.iter_revisions()
+                for key, value in refs.items() if key in empty_tags)
+        head = []
+        missing = set(empty_tags)
+        if self.queue is None:
+            for candidate in scan:
+                head.append(candidate)
+                missing.discard(candidate[1])
+                if not missing:
                     break
-                try:
-                    print(f'Looking through {revision.comment} by {revision.user}')
-                    
-                    content = revision.text
-                    parsed_content = wtp.parse(content)
-                except Exception as e:
-                    print(e)
-                    print("-" * 80)
-                    print("Content")
-                    print("-" * 80)
-                    print(content)
-                    print("-" * 80)
-                    
-                parsed_tags = parsed_content.get_tags(name="ref")
-
-                tags_dict = {}
-                for tag in parsed_tags:
-                    if "name" in tag.attrs:
-                        if len(tag.contents) == 0:
-                            continue
-                        tags_dict[tag.attrs["name"]] = tag
+        return empty_tags, history, itertools.chain(head, scan)
+
+    def treat_page(self) -> None:
+        """Load the given page, do some changes, and save it."""
+        if self.opt.apply:
+            self.apply_reviewed()
+            return
+        text = self.current_page.text    
+        summary = "Підстановка цитувань з попередньої версії статті"
+        
+        empty_tags, history, candidates = self.prefetcher.result(self.current_page)
+        try:
+            if self.queue is not None:
+                if len(empty_tags):
+                    self.collect_candidates(empty_tags, candidates)
+                return  # nothing is saved in the collect phase
+
+            if len(empty_tags):
+                print(empty_tags)
+                revs_taken = {}
+                offered = set()
                 
-                for key, value in tags_dict.items():
-                    if key in empty_tags:
-                        print(f'Found content for {key}: {value}')
-                        print("Press y to accept replacement, n to decline, s to stop search")
-
-                        while True:
-                            press_y = input().lower()
-                            if press_y == "y":
-                                new_ref = value.string
-                                text = text.replace(empty_tags[key], new_ref, 1)
-                                del empty_tags[key]
-                                revs_taken[str(revision.revid)] = str(revision.user) # for edit summary
-                                break
-                            if press_y == "n":
-                                break
-                            if press_y == "s":
-                                stop_search = True
-                                break
-                    
-                    if len(empty_tags) == 0: stop_search = True
-            
-            summary += " (З правок: "
-            for id, user in revs_taken.items():
-                summary += f"{user}: https://uk.wikipedia.org/w/index.php?title={self.current_page.title()}&oldid={id} ;"
-            summary += ")"
+                for revision, key, value in candidates:
+                    if key not in empty_tags or (key, value) in offered:
+                        continue
+                    offered.add((key, value))
+                    print(f'Found content for {key} in {revision.revid} by {revision.user}: {value}')
+                    print("Press y to accept replacement, n to decline, s to stop search")
+
+                    press_y = ""
+                    while press_y not in ["y", "n", "s"]:
+                        press_y = input().lower()
+                    if press_y == "y":
+                        text = text.replace(empty_tags[key], value, 1)
+                        del empty_tags[key]
+                        revs_taken[str(revision.revid)] = str(revision.user) # for edit summary
+                    if press_y == "s" or len(empty_tags) == 0:
+                        break
+                
+                summary = self.summary_with_revs(summary, revs_taken)
+        finally:
+            self.parses_done += history.parses_done
+            self.parses_saved += history.parses_saved
 
         self.put_current(text, summary=summary)
 
@@ -159,18 +365,27 @@ def main(*args: str) -> None:
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text', 'tlang'):
+        if option in ('summary', 'text', 'tlang', 'collect', 'apply'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'prefetch':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
             options[option] = True
 
+    gen = gen_factory.getCombinedGenerator()
+    if options.get('apply'):
+        # the pages come from the review queue; decisions are already made
+        gen = (pywikibot.Page(gen_factory.site, title) for title in accepted_entries(options['apply']))
+        options['always'] = True
+
     # The preloading option is responsible for downloading multiple
     # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    if gen:
+        gen = pagegenerators.PreloadingGenerator(gen)
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
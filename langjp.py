@@ -8,13 +8,77 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
+import bisect
 import re
+from collections import Counter
+
+from pagemodel import Gate, PageModel
+from transformpool import TransformPool
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
+# deprecated or mistaken language codes: the code to use instead
+LANG_CODES = {
+    "jp": "ja",
+    "cz": "cs",
+    "dk": "da",
+    "gr": "el",
+    "ua": "uk",
+    "by": "be",
+    "cn": "zh",
+    "kz": "kk",
+    "vn": "vi",
+    "ge": "ka",
+    "rs": "sr",
+    "iw": "he",
+    "in": "id",
+    "ji": "yi",
+    "jw": "jv",
+    "mo": "ro",
+}
+
+# the language of the foreign article: the third positional argument or a named one
+LANG_ARGS = ("3", "мова", "lang")
+
+# every deprecated code standing as a whole argument value, in one scan of the
+# page; only templates containing a match need their arguments parsed
+CODE_VALUE = re.compile(r'[|=]\s*(%s)\s*(?=[|}])' % '|'.join(LANG_CODES), re.IGNORECASE)
+
+# pages without this are not parsed at all
+GATE = Gate(r'\{\{\s*(?:iw|нп|не перекладено)\s*\|')
+
+
+def fix(page: PageModel) -> None:
+    """Replace deprecated language codes in iw/нп/не перекладено, as span edits of the page model."""
+    candidates = [match.start(1) for match in CODE_VALUE.finditer(page.text)]
+    if not candidates:
+        return
+    for span, template in page.templates("iw", "нп", "не перекладено"):
+        i = bisect.bisect_left(candidates, span[0])
+        if i == len(candidates) or candidates[i] >= span[1]:
+            continue
+        for argument in template.arguments:
+            if argument.name.strip() not in LANG_ARGS:
+                continue
+            value = argument.value
+            code = value.strip()
+            new_code = LANG_CODES.get(code.lower())
+            if new_code:
+                # only the code itself is replaced, the spacing around it stays
+                start = argument.span[1] - len(value) + value.index(code)
+                page.edit(span, start, start + len(code), new_code)
+
+
+def transform(text: str) -> tuple[str, Counter]:
+    """Replace deprecated language codes in iw/нп/не перекладено; return the new text and changed templates per name."""
+    if not GATE.match(text):
+        return text, Counter()
+    page = PageModel(text)
+    fix(page)
+    return page.apply(), page.touched
+
 
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
@@ -31,26 +95,31 @@ class BasicBot(
 
     update_options = {
         'replace': False,  # delete old text and write the new text
-        'summary': "Виправлення коду jp на ja у шаблонах [[Шаблон:нп|нп]]",  # your own bot summary
+        'summary': "Виправлення застарілих кодів мов (jp → ja тощо) у шаблонах [[Шаблон:нп|нп]]",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'workers': 0,  # transform pages in this many processes
     }
 
+    def setup(self) -> None:
+        """Start counting changed templates and the transform workers."""
+        super().setup()
+        self.touched = Counter()
+        self.generator = GATE.filter(self.generator)
+        self.transforms = TransformPool(transform, self.opt.workers)
+        self.generator = self.transforms.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Stop the transform workers and report how many templates were changed."""
+        self.transforms.shutdown()
+        GATE.report()
+        print('Changed templates: ' + ', '.join(f'{name} {count}' for name, count in self.touched.most_common()))
+        super().teardown()
+
     def treat_page(self) -> None:
-        text = self.current_page.text
-
-        parsed = wtp.parse(text)
-        
-        templates = parsed.templates
-        
-        for template in templates:
-            print(template.string)
-            if template.name.lower() in ["iw", "нп", "не перекладено"]:
-                template_str = template.string.replace("jp", "ja")
-                
-                text = text.replace(template.string, template_str)
-                break
-                        
+        text, touched = self.transforms.result(self.current_page)
+        self.touched.update(touched)
+
         self.put_current(text, summary=self.opt.summary)
 
 
@@ -75,6 +144,8 @@ def main(*args: str) -> None:
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'workers':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
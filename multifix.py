@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Run several template fixes over one generator, with one edit per page.
+
+The fixes of langjp.py, rubook.py, tracklist_fix.py, yar-prim.py and
+add_notelist.py are applied to each page in turn: the page is fetched once,
+the template fixes share one parse (pagemodel.PageModel), and the result is
+saved in a single edit whose summary joins the summaries of the fixes that
+changed something. Fixes whose gate does not match the page are not run. A
+fix with an edit inside a template another fix already changed is run again
+on the result, so that the page ends up as if the bots ran one by one.
+
+    python multifix.py -cat:... [-fixes:langjp,rubook] [-workers:N] [-always]
+
+All fixes are run by default. With -workers:N the fixes run in N processes
+(see transformpool.py); the dump runner works too: python dumprun.py
+multifix DUMP.
+"""
+from __future__ import annotations
+
+import functools
+import importlib
+from collections import Counter
+
+import pywikibot
+from pywikibot import pagegenerators
+from pywikibot.bot import (
+    AutomaticTWSummaryBot,
+    ConfigParserBot,
+    ExistingPageBot,
+    SingleSiteBot,
+)
+
+from pagemodel import Gate, PageModel
+from transformpool import TransformPool
+
+# This is required for the text that is shown when you run this script
+# with the parameter -help.
+docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
+
+# in the order they are applied; the template fixes first, on the shared parse
+TEMPLATE_FIXES = ('langjp', 'rubook', 'tracklist_fix')
+FIXES = TEMPLATE_FIXES + ('add_notelist', 'yar-prim')
+
+MODULES = {name: importlib.import_module(name) for name in FIXES}
+
+# yar-prim is a plain regex without a gate of its own
+GATES = {name: module.GATE for name, module in MODULES.items() if hasattr(module, 'GATE')}
+GATES['yar-prim'] = Gate(r'\{\{\s*ЯР-прим\s*\|')
+
+# a page matching none of these needs none of the fixes
+GATE = Gate('|'.join(f'(?:{gate.pattern.pattern})' for gate in GATES.values()))
+
+
+def transform(text: str, fixes=FIXES) -> tuple[str, Counter]:
+    """Apply the fixes; return the new text and the number of changes per fix."""
+    changes = Counter()
+    fixes = [name for name in FIXES if name in fixes and GATES[name].match(text)]
+    if not fixes:
+        return text, changes
+    template_names = None
+    if set(fixes) & {*TEMPLATE_FIXES, 'add_notelist'}:
+        page = PageModel(text)
+        rerun = []
+        for name in TEMPLATE_FIXES:
+            if name in fixes:
+                before = sum(page.touched.values())
+                skipped = page.skipped
+                MODULES[name].fix(page)
+                changes[name] = sum(page.touched.values()) - before
+                if page.skipped > skipped:
+                    rerun.append(name)
+        # the template fixes rename or edit templates, they never add or
+        # remove note templates, so the names of the original parse will do
+        template_names = [template.name.strip().lower() for template in page.parsed.templates]
+        text = page.apply()
+        # edits overlapping those of an earlier fix were dropped; run the fix
+        # again on the new text, so that the result is the same as running
+        # the bots one after another
+        for name in rerun:
+            page = PageModel(text)
+            MODULES[name].fix(page)
+            changes[name] += sum(page.touched.values())
+            text = page.apply()
+    if 'add_notelist' in fixes:
+        text, added = MODULES['add_notelist'].insert_notelist(text, template_names)
+        changes['add_notelist'] = sum(added.values())
+    if 'yar-prim' in fixes:
+        text, removed = MODULES['yar-prim'].transform(text)
+        changes['yar-prim'] = sum(removed.values())
+    return text, +changes
+
+
+class BasicBot(
+    # Refer pywikobot.bot for generic bot classes
+    SingleSiteBot,  # A bot only working on one site
+    ConfigParserBot,  # A bot which reads options from scripts.ini setting file
+    # CurrentPageBot,  # Sets 'current_page'. Process it in treat_page method.
+    #                  # Not needed here because we have subclasses
+    ExistingPageBot,  # CurrentPageBot which only treats existing pages
+    AutomaticTWSummaryBot,  # Automatically defines summary; needs summary_key
+):
+
+    use_redirects = False  # treats non-redirects only
+    summary_key = 'basic-changing'
+
+    update_options = {
+        'fixes': ','.join(FIXES),  # fixes to apply, separated by commas
+        'workers': 0,  # transform pages in this many processes
+    }
+
+    def setup(self) -> None:
+        """Start the transform workers."""
+        super().setup()
+        self.fixes = tuple(name.strip() for name in self.opt.fixes.split(',') if name.strip())
+        unknown = set(self.fixes) - set(FIXES)
+        if unknown:
+            raise ValueError(f'Unknown fixes: {", ".join(sorted(unknown))}')
+        self.changes = Counter()
+        self.generator = GATE.filter(self.generator)
+        self.transforms = TransformPool(functools.partial(transform, fixes=self.fixes), self.opt.workers)
+        self.generator = self.transforms.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Stop the transform workers and report the changes per fix."""
+        self.transforms.shutdown()
+        GATE.report()
+        for name, count in self.changes.most_common():
+            print(f'{name}: {count}')
+        super().teardown()
+
+    def treat_page(self) -> None:
+        text, changes = self.transforms.result(self.current_page)
+        if not changes:
+            return
+        self.changes.update(changes)
+        summary = '; '.join(MODULES[name].BasicBot.update_options['summary']
+                            for name in FIXES if name in changes)
+        self.put_current(text, summary=summary)
+
+
+def main(*args: str) -> None:
+    options = {}
+    # Process global arguments to determine desired site
+    local_args = pywikibot.handle_args(args)
+
+    # This factory is responsible for processing command line arguments
+    # that are also used by other scripts and that determine on which pages
+    # to work on.
+    gen_factory = pagegenerators.GeneratorFactory()
+
+    # Process pagegenerators arguments
+    local_args = gen_factory.handle_args(local_args)
+
+    # Parse your own command line arguments
+    for arg in local_args:
+        arg, _, value = arg.partition(':')
+        option = arg[1:]
+        if option == 'fixes':
+            if not value:
+                pywikibot.input('Please enter a value for ' + arg)
+            options[option] = value
+        elif option == 'workers':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
+        # take the remaining options as booleans.
+        # You will get a hint if they aren't pre-defined in your bot class
+        else:
+            options[option] = True
+
+    # The preloading option is responsible for downloading multiple
+    # pages from the wiki simultaneously.
+    gen = gen_factory.getCombinedGenerator(preload=True)
+
+    # check if further help is needed
+    if not pywikibot.bot.suggest_help(missing_generator=not gen):
+        # pass generator and private options to the bot
+        bot = BasicBot(generator=gen, **options)
+        bot.run()  # guess what it does
+
+
+if __name__ == '__main__':
+    main()
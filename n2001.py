@@ -9,69 +9,21 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
-import re
-import difflib
+from collections import Counter
+
+from refscan import get_ref_tags
+from regions import (
+    RegionIndex,
+    RegionResolver,
+    normalize_region,
+    region_from_infobox,
+    region_pages,
+)
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
-def get_region_from_categories(page):
-    """
-    Визначає область, до якої належить населений пункт, на основі категорій статті, з урахуванням рекурсивного пошуку у батьківських категоріях.
-
-    :param page: Сторінка Вікіпедії про населений пункт.
-    :param regions_dict: Словник, що відображає категорії населених пунктів на області.
-    :return: Назва області або None, якщо область не знайдена.
-    """
-    
-    regions_dict = {
-    "Населені пункти Вінницької області": "Вінницька область",
-    "Населені пункти Волинської області": "Волинська область",
-    "Населені пункти Дніпропетровської області": "Дніпропетровська область",
-    "Населені пункти Донецької області": "Донецька область",
-    "Населені пункти Житомирської області": "Житомирська область",
-    "Населені пункти Закарпатської області": "Закарпатська область",
-    "Населені пункти Запорізької області": "Запорізька область",
-    "Населені пункти Івано-Франківської області": "Івано-Франківська область",
-    "Населені пункти Київської області": "Київська область",
-    "Населені пункти Кіровоградської області": "Кіровоградська область",
-    "Населені пункти Луганської області": "Луганська область",
-    "Населені пункти Львівської області": "Львівська область",
-    "Населені пункти Миколаївської області": "Миколаївська область",
-    "Населені пункти Одеської області": "Одеська область",
-    "Населені пункти Полтавської області": "Полтавська область",
-    "Населені пункти Рівненської області": "Рівненська область",
-    "Населені пункти Сумської області": "Сумська область",
-    "Населені пункти Тернопільської області": "Тернопільська область",
-    "Населені пункти Харківської області": "Харківська область",
-    "Населені пункти Херсонської області": "Херсонська область",
-    "Населені пункти Хмельницької області": "Хмельницька область",
-    "Населені пункти Черкаської області": "Черкаська область",
-    "Населені пункти Чернівецької області": "Чернівецька область",
-    "Населені пункти Чернігівської області": "Чернігівська область"
-    }
-    
-    
-    def check_category_recursively(category, visited):
-        if category.title(with_ns=False) in regions_dict:
-            return regions_dict[category.title(with_ns=False)]
-        visited.add(category)
-        for parent_cat in category.categories():
-            if parent_cat not in visited:
-                region = check_category_recursively(parent_cat, visited)
-                if region:
-                    return region
-        return None
-
-    visited_categories = set()
-    for category in page.categories():
-        region = check_category_recursively(category, visited_categories)
-        if region:
-            return region
-    return None
-
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
@@ -101,8 +53,43 @@ class BasicBot(
         'summary': "Підстановка цитувань 'населення 2001 мова'",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'regioncache': 'regions_cache.json',  # category -> region cache shared between runs
+        'maxdepth': 6,  # how many levels of parent categories to walk up
+        'regionindex': '',  # pageid -> region index built by regions.py
+        'region': '',  # all pages belong to this region; no lookups
     }
 
+    def setup(self) -> None:
+        """Load the category -> region cache and the region index."""
+        super().setup()
+        self.regions = RegionResolver(self.site, self.opt.regioncache, self.opt.maxdepth)
+        self.index = RegionIndex(self.opt.regionindex) if self.opt.regionindex else None
+        self.region_sources = Counter()
+
+    def teardown(self) -> None:
+        """Save the category -> region cache and report where regions came from."""
+        print('Region: ' + ', '.join(f'{source} {count}' for source, count in self.region_sources.most_common()))
+        if self.index is not None:
+            self.index.close()
+        self.regions.save()
+        super().teardown()
+
+    def find_region(self, text: str) -> str | None:
+        """Region from the infobox, then the region index, then the categories."""
+        if self.opt.region:
+            self.region_sources['option'] += 1
+            return self.opt.region
+        region = region_from_infobox(text)
+        source = 'infobox'
+        if region is None and self.index is not None:
+            region = self.index.get(self.current_page.pageid)
+            source = 'index'
+        if region is None:
+            region = self.regions.region_of(self.current_page)
+            source = 'categories'
+        self.region_sources[source if region else 'not found'] += 1
+        return region
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
@@ -118,9 +105,9 @@ class BasicBot(
         # Retrieve your private option
         # Use your own text or use the default 'Test'
         
-        print(self.current_page.extract(lines=2))
-        parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
+        if not self.opt.region:
+            print(self.current_page.extract(lines=2))  # one more request per page
+        tags = get_ref_tags(text)
         tags_dict = {} # only ref tags
         empty_tags = {} # all tags; name (str): stringified tag/template (str)
 
@@ -140,7 +127,7 @@ class BasicBot(
                     empty_tags.pop(name)
 
         if "населення 2001 мова" in empty_tags:
-            region = get_region_from_categories(self.current_page)
+            region = self.find_region(text)
             if region == None:
                 print("region not found")
             else:
@@ -174,21 +161,38 @@ def main(*args: str) -> None:
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text'):
+        if option in ('summary', 'text', 'regioncache', 'regionindex', 'region'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'maxdepth':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    if options.get('region'):
+        region = normalize_region(options['region'])
+        if region is None:
+            pywikibot.error(f"Unknown region {options['region']!r}")
+            return
+        options['region'] = region
+
+    gen = gen_factory.getCombinedGenerator()
+    if options.get('region') and not gen:
+        # the whole category tree of the region
+        gen = region_pages(gen_factory.site, options['region'])
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
+        # Download pages in batches of 50 together with their categories,
+        # so that the region lookup starts without a request per page. With
+        # the region index the categories are only needed for pages missing
+        # from it, and those are loaded on demand; with -region they are not
+        # needed at all.
+        gen = gen_factory.site.preloadpages(
+            gen, groupsize=50, categories=not (options.get('regionindex') or options.get('region')))
         # pass generator and private options to the bot
         bot = BasicBot(generator=gen, **options)
         bot.run()  # guess what it does
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Layout of an article: where its sections, reference lists and footer are.
+
+Scripts that insert something into a page (add_notelist.py) need the end of
+the reference list or the start of the footer (navboxes, authority control,
+DEFAULTSORT, categories). PageLayout finds all of these in one scan of the
+text with one regular expression; comments are skipped as a whole, so
+markup inside them is not taken for real. Everything is then available as
+attributes without another pass over the text.
+"""
+from __future__ import annotations
+
+import re
+
+_LAYOUT = re.compile(r'''
+    (?P<comment><!--.*?(?:-->|\Z))
+  | ^(?P<heading>(?P<level>={1,6})(?P<title>[^\n]+?)(?P=level))[ \t]*$
+  | (?P<references><references\b[^>]*?(?:/>|>.*?</references\s*>))
+  | (?P<reflist>\{\{\s*(?:reflist|примітки|references)\s*(?=[|}]))
+  | (?P<category>\[\[\s*(?:категорія|category)\s*:[^\]]*\]\])
+  | (?P<defaultsort>\{\{\s*(?:DEFAULTSORT|СОРТУВАННЯ)\s*:)
+  | (?P<authority>\{\{\s*(?:authority\ control|бібліоінформація|нормативний\ контроль)\s*(?=[|}]))
+  | ^(?P<template>\{\{)
+''', re.VERBOSE | re.IGNORECASE | re.MULTILINE | re.DOTALL)
+_BRACES = re.compile(r'\{\{|\}\}')
+
+
+def template_end(text: str, start: int) -> int | None:
+    """
+    End of the template starting at text[start] ('{{'), counting nested braces.
+
+    None if the template is never closed; MediaWiki shows such braces as text.
+    """
+    depth = 0
+    for match in _BRACES.finditer(text, start):
+        depth += 1 if match[0] == '{{' else -1
+        if depth == 0:
+            return match.end()
+    return None
+
+
+class PageLayout:
+
+    """
+    Offsets of the layout elements of a page text.
+
+    :ivar sections: (level, title, start, end) of every heading line
+    :ivar reflists: (start, end) of every reference list
+    :ivar categories: (start, end) of every category link
+    :ivar defaultsort: (start, end) of DEFAULTSORT, or None
+    :ivar authority: (start, end) of the authority control template, or None
+    :ivar navboxes: (start, end) of templates standing on their own line
+        after the last reference list, i.e. navigation boxes; without a
+        reference list, those right in front of the categories (with nothing
+        but whitespace between them)
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.sections = []
+        self.reflists = []
+        self.categories = []
+        self.defaultsort = None
+        self.authority = None
+        self.navboxes = []
+        line_templates = []
+        pos = 0
+        while True:
+            match = _LAYOUT.search(text, pos)
+            if match is None:
+                break
+            kind = match.lastgroup
+            start = match.start()
+            end = match.end()
+            if kind == 'heading':
+                self.sections.append((len(match['level']), match['title'].strip(), start, end))
+            elif kind == 'references':
+                self.reflists.append((start, end))
+            elif kind in ('reflist', 'defaultsort', 'authority', 'template'):
+                end = template_end(text, start)
+                if end is None:
+                    pos = match.end()  # unclosed braces are plain text
+                    continue
+                if kind == 'reflist':
+                    self.reflists.append((start, end))
+                elif kind == 'defaultsort':
+                    self.defaultsort = self.defaultsort or (start, end)
+                elif kind == 'authority':
+                    self.authority = self.authority or (start, end)
+                elif text[end:end + 1] in ('', '\n'):
+                    line_templates.append((start, end))
+            elif kind == 'category':
+                self.categories.append((start, end))
+            pos = max(end, pos + 1)
+        if self.reflists:
+            last_reflist = self.reflists[-1][1]
+            self.navboxes = [span for span in line_templates if span[0] >= last_reflist]
+        else:
+            boundary = self.categories_start
+            for start, end in reversed(line_templates):
+                if end > boundary or text[end:boundary].strip():
+                    if self.navboxes:
+                        break
+                    continue  # after the categories, or text follows it
+                self.navboxes.insert(0, (start, end))
+                boundary = start
+        self._section_index = {title.lower(): i for i, (_, title, _, _) in reversed(list(enumerate(self.sections)))}
+
+    def section(self, title: str) -> tuple[int, str, int, int] | None:
+        """The first heading with this title (case-insensitive), or None."""
+        i = self._section_index.get(title.lower())
+        return None if i is None else self.sections[i]
+
+    @property
+    def reflist_end(self) -> int | None:
+        """End of the first reference list, or None if there is none."""
+        return self.reflists[0][1] if self.reflists else None
+
+    @property
+    def categories_start(self) -> int:
+        """Start of the first of authority control, DEFAULTSORT and categories."""
+        starts = [span[0] for span in (self.authority, self.defaultsort) if span]
+        if self.categories:
+            starts.append(self.categories[0][0])
+        return min(starts, default=len(self.text))
+
+    @property
+    def footer_start(self) -> int:
+        """Start of the footer: navboxes and everything from categories_start on."""
+        return min(self.navboxes[0][0], self.categories_start) if self.navboxes else self.categories_start
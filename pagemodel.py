@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Page text parsed once, with template changes collected by span.
+
+The template-fixing bots (langjp.py, rubook.py, tracklist_fix.py) used to
+call text.replace(template.string, new) for every changed template: a copy
+and a scan of the whole text per template, which also rewrote every other
+identical copy of it. PageModel parses the text once, hands out the
+matching templates with their spans in the original text and records each
+change as a span edit, so the new text is built in one pass at the end.
+
+Before any of that, a Gate (a case-insensitive regex every page that needs
+the fix must contain) skips the pages that cannot need it without parsing.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter
+
+import wikitextparser as wtp
+
+from spanedit import OverlappingEdit, SpanEdits
+
+
+class Gate:
+
+    """
+    Cheap test a page must pass to be worth parsing.
+
+    :ivar passed: pages let through by filter()
+    :ivar failed: pages skipped by filter()
+    """
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.passed = 0
+        self.failed = 0
+
+    def match(self, text: str) -> bool:
+        return self.pattern.search(text) is not None
+
+    def filter(self, pages):
+        """Yield only the pages whose text matches, counting both kinds."""
+        for page in pages:
+            if self.match(page.text):
+                self.passed += 1
+                yield page
+            else:
+                self.failed += 1
+
+    def report(self) -> None:
+        print(f'Gate: {self.passed} pages parsed, {self.failed} skipped')
+
+
+class PageModel:
+
+    """
+    One page text and the template changes made to it.
+
+    :ivar parsed: wtp.WikiText of the text; templates may be changed in place
+        before their new string is passed to replace()
+    :ivar touched: changed templates per (lowercase) template name
+    :ivar skipped: changes dropped because they overlap an earlier change,
+        e.g. a template nested in one that was already changed
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.parsed = wtp.parse(text)
+        self.touched = Counter()
+        self.skipped = 0
+        self._edits = SpanEdits(text)
+        # spans taken before anything is changed in place, which shifts them
+        self._templates = [(template.span, template) for template in self.parsed.templates]
+        self._names = {}  # span: template name
+
+    def templates(self, *names: str):
+        """
+        Return (span, template) for the templates with one of the names.
+
+        Names are compared lowercase and stripped. The spans refer to the
+        original text and stay valid after templates are changed in place.
+        """
+        names = {name.lower() for name in names}
+        found = []
+        for span, template in self._templates:
+            name = template.name.strip().lower()
+            if name in names:
+                found.append((span, template))
+                self._names[span] = name
+        return found
+
+    def replace(self, span: tuple[int, int], new: str) -> bool:
+        """Replace the template at span with new; return False if nothing was changed."""
+        return self.edit(span, *span, new)
+
+    def edit(self, span: tuple[int, int], start: int, end: int, new: str) -> bool:
+        """
+        Replace text[start:end], a part of the template at span, with new.
+
+        Unlike changing the template in place and passing its string to
+        replace(), this does not touch the wtp tree, whose every change
+        costs time proportional to the number of nodes on the page.
+        """
+        if self.text[start:end] == new:
+            return False
+        try:
+            self._edits.replace(start, end, new)
+        except OverlappingEdit:
+            self.skipped += 1
+            return False
+        self.touched[self._names.get(span, '')] += 1
+        return True
+
+    def apply(self) -> str:
+        """The text with all changes applied."""
+        return self._edits.apply() if self._edits else self.text
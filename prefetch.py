@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Background preparation of the next pages while the operator answers prompts.
+
+Used by fixrefs.py, transrefs.py and histrefs.py with -prefetch:K. The bot
+splits its work into prepare_page(page), which downloads and analyses a page
+without asking anything, and treat_page, which asks and saves. Prefetcher
+keeps prepare_page running for the next K pages of the generator in worker
+threads, so the prompts for a page appear as soon as the previous page is
+done.
+"""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+
+    """Run prepare(page) ahead of the bot for up to depth pages."""
+
+    def __init__(self, prepare, depth: int = 0) -> None:
+        self.prepare = prepare
+        self.depth = depth
+        self._pool = ThreadPoolExecutor(max_workers=depth) if depth > 0 else None
+        self._futures = {}  # id(page): future of the page being treated
+
+    def wrap(self, pages):
+        """Yield the pages of the generator, preparing the next ones in background."""
+        if self._pool is None:
+            yield from pages
+            return
+        pages = iter(pages)
+        pending = deque()
+
+        def fill():
+            while len(pending) < self.depth:
+                page = next(pages, None)
+                if page is None:
+                    return
+                pending.append((page, self._pool.submit(self.prepare, page)))
+
+        fill()
+        while pending:
+            page, future = pending.popleft()
+            self._futures = {id(page): future}
+            fill()
+            yield page
+
+    def result(self, page):
+        """Return the prepared data of the page, preparing it now if needed."""
+        future = self._futures.pop(id(page), None)
+        if future is None:
+            return self.prepare(page)
+        return future.result()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            # pages already being prepared are finished, as they may still
+            # use resources (e.g. the refs cache) the bot closes afterwards
+            self._pool.shutdown(wait=True, cancel_futures=True)
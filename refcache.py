@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of named refs found on foreign-wiki pages.
+
+Used by transrefs.py and transrefs2.py. Maps (lang, title) to the revid the
+refs were taken from and {ref name: ref tag string}. An entry is only used
+while its revid matches the latest revision of the page, so a changed page
+is downloaded and parsed again. The total size of stored refs is capped;
+least recently used pages are dropped first.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class RefCache:
+
+    """SQLite-backed LRU cache of named refs per foreign page."""
+
+    def __init__(self, path: str = 'refcache.sqlite', max_bytes: int = 100 * 2**20) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # shared by the fetch threads of transrefs2.py
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS refs ('
+            ' lang TEXT, title TEXT, revid INTEGER, refs TEXT,'
+            ' size INTEGER, last_used REAL,'
+            ' PRIMARY KEY (lang, title))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS refs_lru ON refs (last_used)')
+        self._conn.commit()
+
+    def get(self, lang: str, title: str, revid: int) -> dict[str, str] | None:
+        """Return cached refs of the page at revid, or None if missing or stale."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT revid, refs FROM refs WHERE lang = ? AND title = ?',
+                (lang, title)).fetchone()
+            if row is None or row[0] != revid:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                'UPDATE refs SET last_used = ? WHERE lang = ? AND title = ?',
+                (time.time(), lang, title))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[1])
+
+    def put(self, lang: str, title: str, revid: int, refs: dict[str, str]) -> None:
+        """Store refs of the page at revid, replacing any older revision."""
+        data = json.dumps(refs, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?, ?)',
+                (lang, title, revid, data, len(data.encode()), time.time()))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM refs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            'SELECT lang, title, size FROM refs ORDER BY last_used').fetchall()
+        for lang, title, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(
+                'DELETE FROM refs WHERE lang = ? AND title = ?', (lang, title))
+            total -= size
+
+    def close(self) -> None:
+        print(f'Ref cache: {self.hits} hits, {self.misses} misses')
+        self._conn.close()
+
+
+def load_named_refs(page, extract, cache: RefCache | None = None, index=None) -> dict[str, str]:
+    """
+    Return named refs of a foreign page, from the cache when it is current.
+
+    :param page: pywikibot.Page on the foreign wiki
+    :param extract: callable turning page text into {ref name: ref tag string}
+    :param cache: RefCache to consult, or None to always download
+    :param index: dumprefs.RefIndex consulted before anything else; a page
+        found there needs no request to its wiki
+    """
+    if index is not None:
+        refs = index.get(page.site.lang, page.title())
+        if refs is not None:
+            return refs
+    if cache is None:
+        return extract(page.text)
+    lang = page.site.lang
+    title = page.title()
+    revid = page.latest_revision_id  # metadata only, no page text
+    refs = cache.get(lang, title, revid)
+    if refs is None:
+        refs = extract(page.text)
+        cache.put(lang, title, revid, refs)
+    return refs
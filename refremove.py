@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Removal of list-defined refs by name, used by 2001.py.
+
+List-defined refs live in the refs= argument of {{reflist}} / {{примітки}}
+or between <references> and </references>; the article body only refers to
+them with <ref name="..." />. RefRemover drops the definitions with the given
+names from all of these lists at once: the names are compiled into one
+alternation, and every match of it that falls on the name of a ref tag
+(found in one scan with refscan) inside a list becomes a span edit
+(SpanEdits); pages without any match are left without further scanning.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+from collections import Counter
+
+from pagelayout import template_end
+from refscan import get_ref_tags
+from spanedit import SpanEdits
+
+
+def split_names(value: str) -> list[str]:
+    """'населення 2001 мова|розподіл за мовою' -> ['населення 2001 мова', 'розподіл за мовою']."""
+    return [name.strip() for name in value.split('|') if name.strip()]
+
+
+class RefRemover:
+
+    """Remove list-defined refs with the given names."""
+
+    def __init__(self, names, templates=('reflist', 'примітки')) -> None:
+        self.names = set(names)
+        self.templates = {template.lower() for template in templates}
+        # longest first, so that a name is not cut short by its own prefix
+        self.pattern = re.compile('|'.join(
+            re.escape(name) for name in sorted(self.names, key=len, reverse=True)))
+        # <references> bodies, or the start of a list template
+        self.lists = re.compile(
+            r'<references\b[^>/]*>(.*?)</references\s*>'
+            r'|\{\{\s*(?:' + '|'.join(re.escape(template) for template in self.templates) + r')\s*(?=[|}])',
+            re.DOTALL | re.IGNORECASE)
+
+    def list_bodies(self, text: str) -> list[tuple[int, int]]:
+        """Spans of list templates and <references> bodies, outermost only."""
+        spans = []
+        for match in self.lists.finditer(text):
+            if match[1] is not None:
+                spans.append(match.span(1))
+            else:
+                end = template_end(text, match.start())
+                if end is not None:
+                    spans.append((match.start(), end))
+        spans.sort()
+        bodies = []
+        for start, end in spans:
+            if bodies and start < bodies[-1][1]:
+                continue  # inside a list already found
+            bodies.append((start, end))
+        return bodies
+
+    def remove(self, text: str) -> tuple[str, Counter]:
+        """
+        Return the text without the matching definitions and the removals per name.
+
+        Refs with the same names outside the lists are left alone.
+        """
+        removed = Counter()
+        hits = [match.start() for match in self.pattern.finditer(text)]
+        if not hits:
+            return text, removed
+        bodies = self.list_bodies(text)
+        if not bodies:
+            return text, removed
+        body_starts = [start for start, _ in bodies]
+        tags = sorted(get_ref_tags(text), key=lambda tag: tag.span)
+        tag_starts = [tag.span[0] for tag in tags]
+        edits = SpanEdits(text)
+        done = set()
+        for pos in hits:
+            i = bisect.bisect_right(tag_starts, pos) - 1
+            if i < 0 or i in done:
+                continue
+            tag = tags[i]
+            start, end = tag.span
+            if pos >= end or tag.name not in self.names:
+                continue  # the name is not in a ref tag, or not its name
+            j = bisect.bisect_right(body_starts, start) - 1
+            if j < 0 or end > bodies[j][1]:
+                continue  # not in a list
+            done.add(i)
+            edits.replace(start, end, '')
+            removed[tag.name] += 1
+        return (edits.apply() if edits else text), removed
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Fast single-pass scanner for <ref> tags.
+
+Most scripts here only need the list of ref tags with their names and
+contents, and building a full wikitextparser tree for that is slow on large
+articles. scan_refs() walks the text once with one regular expression,
+skipping comments, <nowiki> and other blocks whose contents are not parsed
+as wikitext. get_ref_tags() falls back to wikitextparser when the markup is
+ambiguous (nested, unclosed or stray ref tags).
+
+The returned RefTag records mimic the parts of wikitextparser's Tag used by
+the scripts: attrs, contents, string and span.
+"""
+from __future__ import annotations
+
+import re
+
+import wikitextparser as wtp
+
+
+class AmbiguousMarkup(ValueError):
+
+    """The ref markup cannot be scanned reliably without a full parser."""
+
+
+class RefTag:
+
+    """A <ref> tag found in a page.
+
+    :ivar attrs: tag attributes, e.g. {'name': 'a', 'group': 'ком'}
+    :ivar contents: text between <ref ...> and </ref>; '' if self-closing
+    :ivar string: the whole tag as it appears in the text
+    :ivar span: (start, end) of the whole tag in the text
+    :ivar contents_span: (start, end) of the contents, None if self-closing
+    """
+
+    __slots__ = ('attrs', 'contents', 'string', 'span', 'contents_span')
+
+    def __init__(self, attrs, contents, string, span, contents_span) -> None:
+        self.attrs = attrs
+        self.contents = contents
+        self.string = string
+        self.span = span
+        self.contents_span = contents_span
+
+    @property
+    def name(self) -> str | None:
+        return self.attrs.get('name')
+
+    @property
+    def group(self) -> str | None:
+        return self.attrs.get('group')
+
+    @property
+    def self_closing(self) -> bool:
+        return self.contents_span is None
+
+    def __str__(self) -> str:
+        return self.string
+
+    def __repr__(self) -> str:
+        return f'RefTag({self.string!r}, span={self.span})'
+
+
+# Blocks whose contents are not wikitext are matched as a whole and skipped;
+# group 4 is set only if the block is closed.
+_TOKEN = re.compile(
+    r'<!--.*?(?:(-->)|\Z)'
+    r'|<(nowiki|pre|math|chem|score|syntaxhighlight|source)\b[^>]*?(?<!/)>.*?(?:(</\2\s*>)|\Z)'
+    r'|<(/?)ref\b([^>]*)>',
+    re.DOTALL | re.IGNORECASE)
+_ATTR = re.compile(r'''([^\s=/"']+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"']+))''')
+
+
+def parse_attrs(attrs_str: str) -> dict[str, str]:
+    """
+    Parse the attributes of a tag, quoted or not.
+
+    :raises AmbiguousMarkup: if something is left over, e.g. an unclosed
+        quote of name="a>b", whose value was cut at the '>'
+    """
+    attrs = {}
+    for match in _ATTR.finditer(attrs_str):
+        value = next(v for v in match.groups()[1:] if v is not None)
+        attrs[match[1].lower()] = value.strip()
+    if _ATTR.sub('', attrs_str).strip():
+        raise AmbiguousMarkup(f'unparsed tag attributes {attrs_str!r}')
+    return attrs
+
+
+def scan_refs(text: str) -> list[RefTag]:
+    """
+    Return all ref tags of the text in document order.
+
+    :raises AmbiguousMarkup: on nested, unclosed or stray ref tags, on
+        unclosed comments and non-wikitext blocks, and on attributes that
+        cannot be parsed
+    """
+    tags = []
+    opened = None  # (start, contents start, attrs) of the unclosed <ref>
+    for match in _TOKEN.finditer(text):
+        if match[5] is None:  # comment or non-wikitext block
+            if match[1] is None and match[3] is None:
+                raise AmbiguousMarkup(f'unclosed {match[0][:10]!r} at {match.start()}')
+            continue
+        start, end = match.span()
+        if match[4]:  # </ref>
+            if opened is None:
+                raise AmbiguousMarkup(f'stray </ref> at {start}')
+            tag_start, contents_start, attrs = opened
+            tags.append(RefTag(attrs, text[contents_start:start], text[tag_start:end],
+                               (tag_start, end), (contents_start, start)))
+            opened = None
+            continue
+        if opened is not None:
+            raise AmbiguousMarkup(f'<ref> inside <ref> at {start}')
+        attrs_str = match[5].rstrip()
+        if attrs_str.endswith('/'):
+            tags.append(RefTag(parse_attrs(attrs_str[:-1]), '', match[0], (start, end), None))
+        else:
+            opened = (start, end, parse_attrs(attrs_str))
+    if opened is not None:
+        raise AmbiguousMarkup(f'unclosed <ref> at {opened[0]}')
+    return tags
+
+
+def _from_wtp(text: str) -> list[RefTag]:
+    tags = []
+    for tag in wtp.parse(text).get_tags(name='ref'):
+        start, end = tag.span
+        string = tag.string
+        if string.rstrip().endswith('/>'):
+            contents_span = None
+        else:
+            # counted back from the closing tag: an attribute value may contain '>'
+            contents_end = start + string.rindex('</')
+            contents_span = (contents_end - len(tag.contents), contents_end)
+        # older wikitextparser versions keep the slash of <ref name=a/> in the name
+        attrs = {name: value.rstrip('/') if name == 'name' else value
+                 for name, value in tag.attrs.items()}
+        tags.append(RefTag(attrs, tag.contents, string, (start, end), contents_span))
+    return tags
+
+
+def get_ref_tags(text: str) -> list[RefTag]:
+    """Drop-in for wtp.parse(text).get_tags(name="ref") using the fast scanner.
+
+    Falls back to wikitextparser only if the markup is ambiguous.
+    """
+    try:
+        return scan_refs(text)
+    except AmbiguousMarkup:
+        return _from_wtp(text)
+
+
+def extract_named_refs(text: str) -> dict[str, str]:
+    """Return {ref name: ref tag string} for every named ref with contents."""
+    refs = {}
+    for tag in get_ref_tags(text):
+        if 'name' in tag.attrs and len(tag.contents) != 0:
+            refs[tag.attrs['name']] = tag.string
+    return refs
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Region (oblast) of a settlement for n2001.py.
+
+RegionResolver goes up from the categories of an article to their parent
+categories, breadth first, until it finds one of the "Населені пункти ...
+області" categories. Parent categories are requested in batches of 50, and
+the result for every category (including the absence of a region) is kept
+on disk, so the same categories are not requested again for other pages or
+in later runs.
+
+RegionIndex goes the other way, top down: it walks the subcategories of the
+24 region categories once and stores the id of every article with its
+region, after which n2001.py finds the region without any request. To build
+or update the index:
+
+    python regions.py [regions.sqlite] [-rebuild]
+
+Running it again adds only the articles and subcategories added to the known
+categories since the previous update. Removals from a category are not seen
+that way; use -rebuild for them.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import sys
+from collections import deque
+
+import pywikibot
+from pywikibot.data import api
+
+REGIONS = {
+    "Населені пункти Вінницької області": "Вінницька область",
+    "Населені пункти Волинської області": "Волинська область",
+    "Населені пункти Дніпропетровської області": "Дніпропетровська область",
+    "Населені пункти Донецької області": "Донецька область",
+    "Населені пункти Житомирської області": "Житомирська область",
+    "Населені пункти Закарпатської області": "Закарпатська область",
+    "Населені пункти Запорізької області": "Запорізька область",
+    "Населені пункти Івано-Франківської області": "Івано-Франківська область",
+    "Населені пункти Київської області": "Київська область",
+    "Населені пункти Кіровоградської області": "Кіровоградська область",
+    "Населені пункти Луганської області": "Луганська область",
+    "Населені пункти Львівської області": "Львівська область",
+    "Населені пункти Миколаївської області": "Миколаївська область",
+    "Населені пункти Одеської області": "Одеська область",
+    "Населені пункти Полтавської області": "Полтавська область",
+    "Населені пункти Рівненської області": "Рівненська область",
+    "Населені пункти Сумської області": "Сумська область",
+    "Населені пункти Тернопільської області": "Тернопільська область",
+    "Населені пункти Харківської області": "Харківська область",
+    "Населені пункти Херсонської області": "Херсонська область",
+    "Населені пункти Хмельницької області": "Хмельницька область",
+    "Населені пункти Черкаської області": "Черкаська область",
+    "Населені пункти Чернівецької області": "Чернівецька область",
+    "Населені пункти Чернігівської області": "Чернігівська область",
+}
+
+# Old region names and names of historical lands, as found in infoboxes.
+ALIASES = {
+    "вінниччина": "Вінницька область",
+    "волинь": "Волинська область",
+    "дніпропетровщина": "Дніпропетровська область",
+    "донеччина": "Донецька область",
+    "сталінська": "Донецька область",
+    "житомирщина": "Житомирська область",
+    "закарпаття": "Закарпатська область",
+    "запоріжжя": "Запорізька область",
+    "запорожська": "Запорізька область",
+    "івано-франківщина": "Івано-Франківська область",
+    "прикарпаття": "Івано-Франківська область",
+    "станіславська": "Івано-Франківська область",
+    "київщина": "Київська область",
+    "кіровоградщина": "Кіровоградська область",
+    "луганщина": "Луганська область",
+    "ворошиловградська": "Луганська область",
+    "львівщина": "Львівська область",
+    "миколаївщина": "Миколаївська область",
+    "одещина": "Одеська область",
+    "полтавщина": "Полтавська область",
+    "рівненщина": "Рівненська область",
+    "ровенська": "Рівненська область",
+    "сумщина": "Сумська область",
+    "тернопільщина": "Тернопільська область",
+    "харківщина": "Харківська область",
+    "херсонщина": "Херсонська область",
+    "хмельниччина": "Хмельницька область",
+    "кам'янець-подільська": "Хмельницька область",
+    "черкащина": "Черкаська область",
+    "буковина": "Чернівецька область",
+    "чернігівщина": "Чернігівська область",
+}
+
+REGION_NAMES = {region.lower().removesuffix(' область'): region for region in REGIONS.values()}
+REGION_NAMES.update(ALIASES)
+
+# |область = ... in the infobox of a settlement
+INFOBOX_PARAM = re.compile(r'^\s*\|\s*область\s*=[ \t]*(.*)$', re.MULTILINE)
+
+
+def normalize_region(value: str) -> str | None:
+    """
+    Region name from REGIONS for the value of the infobox parameter.
+
+    '[[Київська область|Київська]]', 'Київська', 'Київщина' -> 'Київська область';
+    None if the value looks like none of the regions.
+    """
+    link = re.match(r'\s*\[\[([^\]|]+)', value)
+    if link:
+        value = link[1]
+    else:
+        value = re.split(r'\||}}|<', value, maxsplit=1)[0]
+    key = value.strip().lower().replace('’', "'").replace('ʼ', "'")
+    return REGION_NAMES.get(key.removesuffix(' область').strip())
+
+
+def region_from_infobox(text: str) -> str | None:
+    """Region from the "область" parameter of the article infobox, if present and recognized."""
+    for match in INFOBOX_PARAM.finditer(text):
+        region = normalize_region(match[1])
+        if region:
+            return region
+    return None
+
+
+def strip_ns(title: str) -> str:
+    """'Категорія:Села Київської області' -> 'Села Київської області'."""
+    return title.partition(':')[2] or title
+
+
+class RegionResolver:
+
+    """
+    Region of a page by its categories, with a cache shared by all pages.
+
+    :ivar cache: category title: region, or '' if no region was found
+    """
+
+    def __init__(self, site, path: str = 'regions_cache.json', max_depth: int = 6) -> None:
+        self.site = site
+        self.path = path
+        self.max_depth = max_depth
+        self.cache = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.cache = json.load(f)
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def fetch_parents(self, titles) -> dict[str, list[str]]:
+        """Parent categories of a list of categories, one request per 50 titles."""
+        parents = {title: [] for title in titles}
+        titles = list(titles)
+        for start in range(0, len(titles), 50):
+            batch = [f'Category:{title}' for title in titles[start:start + 50]]
+            self.requests += 1
+            gen = api.PropertyGenerator('categories', site=self.site,
+                                        parameters={'titles': batch, 'cllimit': 'max'})
+            for page in gen:
+                title = strip_ns(page['title'])
+                parents.setdefault(title, []).extend(
+                    strip_ns(category['title']) for category in page.get('categories', []))
+        return parents
+
+    def resolve(self, categories) -> dict[str, str]:
+        """
+        Find the region of each of the categories.
+
+        The search goes breadth first from all categories not in the cache at
+        once, at most max_depth levels up. Every category reached on the way
+        becomes an origin of its own, so its region is cached as well.
+
+        :return: category: region ('' if not found)
+        """
+        result = {}
+        origins = {}  # category on the current level: set of origins
+        for category in categories:
+            if category in self.cache:
+                self.hits += 1
+                result[category] = self.cache[category]
+            elif category in REGIONS:
+                result[category] = self.cache[category] = REGIONS[category]
+            else:
+                self.misses += 1
+                origins.setdefault(category, set()).add(category)
+        unresolved = {origin for origin_set in origins.values() for origin in origin_set}
+        # category: origins that have already reached it; a shared parent
+        # category is walked further for each of them
+        visited = {category: set(origin_set) for category, origin_set in origins.items()}
+        depth = 0
+        while origins and unresolved and depth < self.max_depth:
+            depth += 1
+            parents = self.fetch_parents(origins)
+            next_origins = {}
+            for category, origin_set in origins.items():
+                origin_set &= unresolved
+                for parent in parents.get(category, []):
+                    region = REGIONS.get(parent) or self.cache.get(parent)
+                    if region:
+                        for origin in origin_set:
+                            result[origin] = self.cache[origin] = region
+                        unresolved -= origin_set
+                    elif parent not in self.cache:
+                        new_origins = origin_set - visited.setdefault(parent, set())
+                        if new_origins and parent not in visited[parent]:
+                            new_origins.add(parent)  # reached for the first time
+                            unresolved.add(parent)
+                        if new_origins:
+                            visited[parent] |= new_origins
+                            next_origins.setdefault(parent, set()).update(new_origins)
+            origins = {category: origin_set & unresolved
+                       for category, origin_set in next_origins.items() if origin_set & unresolved}
+        # a search cut off at max_depth is not cached: the region may be higher up
+        cut_off = {origin for origin_set in origins.values() for origin in origin_set}
+        for origin in unresolved:
+            if origin not in cut_off:
+                self.cache[origin] = ''  # the whole tree was walked, there is no region
+            result[origin] = ''
+        return {category: result[category] for category in categories}
+
+    def region_of(self, page) -> str | None:
+        """Region of the settlement, or None if it was not found."""
+        categories = [category.title(with_ns=False) for category in page.categories()]
+        regions = self.resolve(categories)
+        for category in categories:
+            if regions.get(category):
+                return regions[category]
+        return None
+
+    def save(self) -> None:
+        print(f'Categories: {self.hits} from cache, {self.misses} searched, {self.requests} requests')
+        if self.path:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f, ensure_ascii=False, indent=0, sort_keys=True)
+
+
+def walk_category_tree(site, seeds, known: set[str]):
+    """
+    Walk a category tree breadth first.
+
+    Every category is walked once, so cycles in the tree do no harm.
+
+    :param seeds: (category, region, time): the categories to start from;
+        if time is not None, only members added after it are taken
+    :param known: categories already walked; new ones are added to it
+    :return: generator of (region, page); only subcategories not yet in
+        known are yielded
+    """
+    queue = deque(seeds)
+    while queue:
+        title, region, since = queue.popleft()
+        members = site.categorymembers(
+            pywikibot.Category(site, title), member_type=['page', 'subcat'],
+            sortby='timestamp' if since else None, starttime=since)
+        for member in members:
+            if member.namespace() == 14:
+                subcat = member.title(with_ns=False)
+                if subcat in known:
+                    continue
+                known.add(subcat)
+                queue.append((subcat, region, None))
+            yield region, member
+
+
+def region_pages(site, region: str):
+    """All articles in the "Населені пункти ... області" category tree of the region."""
+    category = next(category for category, name in REGIONS.items() if name == region)
+    seen = set()
+    for _, member in walk_category_tree(site, [(category, region, None)], {category}):
+        if member.namespace() == 0 and member.pageid not in seen:
+            seen.add(member.pageid)
+            yield member
+
+
+class RegionIndex:
+
+    """SQLite index of pageid -> region, built by walking the categories top down."""
+
+    def __init__(self, path: str = 'regions.sqlite') -> None:
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS regions (id INTEGER PRIMARY KEY, name TEXT UNIQUE);'
+            'CREATE TABLE IF NOT EXISTS pages (pageid INTEGER PRIMARY KEY, region INTEGER);'
+            'CREATE TABLE IF NOT EXISTS categories (title TEXT PRIMARY KEY, region INTEGER);'
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);')
+        self._conn.executemany('INSERT OR IGNORE INTO regions (name) VALUES (?)',
+                               ((region,) for region in REGIONS.values()))
+        self._conn.commit()
+        self._region_ids = dict(self._conn.execute('SELECT name, id FROM regions'))
+        self._regions = {}  # pageid: region, loaded on first use
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pageid: int) -> str | None:
+        """Region of the article with this id, or None if it is not in the index."""
+        if not self._loaded:
+            names = {region_id: name for name, region_id in self._region_ids.items()}
+            self._regions = {pageid: names[region_id] for pageid, region_id
+                             in self._conn.execute('SELECT pageid, region FROM pages')}
+            self._loaded = True
+        region = self._regions.get(pageid)
+        if region is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return region
+
+    def _walk(self, site, seeds) -> tuple[int, int]:
+        """
+        Walk the categories, storing articles and new subcategories.
+
+        :param seeds: as for walk_category_tree
+        :return: number of new articles and new categories
+        """
+        known = {title for title, in self._conn.execute('SELECT title FROM categories')}
+        pages = categories = 0
+        for count, (region, member) in enumerate(walk_category_tree(site, seeds, known), 1):
+            region_id = self._region_ids[region]
+            if member.namespace() == 14:
+                categories += 1
+                self._conn.execute('INSERT INTO categories VALUES (?, ?)',
+                                   (member.title(with_ns=False), region_id))
+            elif member.namespace() == 0:
+                pages += self._conn.execute('INSERT OR IGNORE INTO pages VALUES (?, ?)',
+                                            (member.pageid, region_id)).rowcount
+            if count % 500 == 0:
+                self._conn.commit()
+                print(f'{pages} articles, {categories} categories', end='\r')
+        self._conn.commit()
+        return pages, categories
+
+    def update(self, site, rebuild: bool = False) -> None:
+        """Build the index, or add the changes since the previous update to it."""
+        started = site.server_time()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'updated'").fetchone()
+        if rebuild or row is None:
+            self._conn.executescript('DELETE FROM pages; DELETE FROM categories;')
+            self._conn.executemany('INSERT INTO categories VALUES (?, ?)',
+                                   ((category, self._region_ids[region])
+                                    for category, region in REGIONS.items()))
+            seeds = [(category, region, None) for category, region in REGIONS.items()]
+        else:
+            since = pywikibot.Timestamp.fromISOformat(row[0])
+            names = {region_id: name for name, region_id in self._region_ids.items()}
+            seeds = [(title, names[region_id], since) for title, region_id
+                     in self._conn.execute('SELECT title, region FROM categories').fetchall()]
+        pages, categories = self._walk(site, seeds)
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('updated', ?)", (started.isoformat(),))
+        self._conn.commit()
+        print(f'Added {pages} articles and {categories} categories')
+
+    def close(self) -> None:
+        print(f'Region index: {self.hits} found, {self.misses} missing')
+        self._conn.close()
+
+
+def main(*args: str) -> None:
+    local_args = pywikibot.handle_args(args)
+    path = 'regions.sqlite'
+    rebuild = False
+    for arg in local_args:
+        if arg == '-rebuild':
+            rebuild = True
+        else:
+            path = arg
+    index = RegionIndex(path)
+    index.update(pywikibot.Site(), rebuild=rebuild)
+    index.close()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
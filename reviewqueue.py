@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Review queue for the two-phase mode of transrefs.py and histrefs.py.
+
+1. Collect: run the bot with -collect:queue.jsonl. It goes through the
+   generator unattended and appends every candidate ref substitution to
+   the queue instead of asking, without saving anything.
+2. Review: python reviewqueue.py queue.jsonl asks y/n for every undecided
+   entry, offline, and writes the decisions back to the file. The file can
+   also be edited by hand ("decision": "y" or "n").
+3. Apply: run the bot with -apply:queue.jsonl. It loads only the pages with
+   accepted entries, skips those whose revid changed since collection, and
+   saves the rest without further questions.
+
+Each line of the queue is a JSON object with the keys title, revid (of the
+page at collection time), name (ref name), target (the empty ref or {{R}}
+to replace), candidate (full ref tag), source and decision. An entry is
+identified by title, revid, name and candidate: collecting the same page
+again does not add it twice and keeps its decision, and once a page is
+collected at a newer revision its older entries are dropped.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+from collections import defaultdict
+
+
+def entry_key(entry: dict) -> tuple:
+    return entry['title'], entry['revid'], entry['name'], entry['candidate']
+
+
+class ReviewQueue:
+
+    """Writer used in the collect phase, keyed by entry_key."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.count = 0
+        self._keys = set()
+        if os.path.exists(path):
+            self._keys = {entry_key(entry) for entry in load_entries(path)}
+
+    def add(self, page, name: str, target: str, candidate: str, source: dict) -> None:
+        entry = {
+            'title': page.title(),
+            'revid': page.latest_revision_id,
+            'name': name,
+            'target': target,
+            'candidate': candidate,
+            'source': source,
+            'decision': None,
+        }
+        key = entry_key(entry)
+        if key in self._keys:
+            return  # collected in an earlier run, maybe already decided
+        self._keys.add(key)
+        # one line per entry, written at once, so an interrupted run keeps
+        # everything collected so far; load_entries drops the outdated ones
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self) -> None:
+        """Rewrite the queue without the entries of outdated revisions."""
+        if os.path.exists(self.path):
+            save_entries(self.path, load_entries(self.path))
+
+
+def load_entries(path: str) -> list[dict]:
+    """
+    Return the entries of the queue in order, each key once.
+
+    The first line of a key wins, so a decision survives a later collection
+    of the same page; only the entries of the latest revid of a page are kept.
+    """
+    entries = {}
+    revids = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            entries.setdefault(entry_key(entry), entry)
+            revids[entry['title']] = max(revids.get(entry['title'], entry['revid']), entry['revid'])
+    return [entry for entry in entries.values() if entry['revid'] == revids[entry['title']]]
+
+
+def save_entries(path: str, entries: list[dict]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def accepted_entries(path: str) -> dict[str, list[dict]]:
+    """Return {title: accepted entries} in queue order."""
+    pages = defaultdict(list)
+    for entry in load_entries(path):
+        if entry['decision'] == 'y':
+            pages[entry['title']].append(entry)
+    return pages
+
+
+def apply_entries(text: str, entries: list[dict]) -> tuple[str, list[dict]]:
+    """
+    Replace the targets of accepted entries in the text.
+
+    Only the first accepted candidate for a ref name is used.
+
+    :return: new text and the entries actually applied
+    """
+    applied = []
+    names = set()
+    for entry in entries:
+        if entry['name'] in names or entry['target'] not in text:
+            continue
+        text = text.replace(entry['target'], entry['candidate'], 1)
+        names.add(entry['name'])
+        applied.append(entry)
+    return text, applied
+
+
+def review(path: str) -> None:
+    """Ask for a decision on every undecided entry of the queue."""
+    entries = load_entries(path)
+    decided = {}  # (title, name): 'y' once a candidate is accepted for it
+    try:
+        for entry in entries:
+            key = (entry['title'], entry['name'])
+            if entry['decision'] is not None:
+                if entry['decision'] == 'y':
+                    decided[key] = 'y'
+                continue
+            if key in decided:
+                entry['decision'] = 'n'  # another candidate already accepted
+                continue
+            print(f"{entry['title']} ({entry['source']})")
+            print(f"Found content for {entry['name']}: {entry['candidate']}")
+            print("Press y to accept replacement, n to decline, q to save and quit")
+            answer = ''
+            while answer not in ['y', 'n', 'q']:
+                answer = input().lower()
+            if answer == 'q':
+                break
+            entry['decision'] = answer
+            if answer == 'y':
+                decided[key] = 'y'
+    finally:
+        save_entries(path, entries)
+
+
+if __name__ == '__main__':
+    review(sys.argv[1])
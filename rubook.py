@@ -8,13 +8,39 @@ from pywikibot.bot import (
     ExistingPageBot,
     SingleSiteBot,
 )
-import wikitextparser as wtp
-import re
+from collections import Counter
+
+from pagemodel import Gate, PageModel
+from transformpool import TransformPool
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
+# pages without this are not parsed at all
+GATE = Gate('заглавие')
+
+
+def fix(page: PageModel) -> None:
+    """Книга with Russian arguments -> книга-ру, as span edits of the page model."""
+    for span, template in page.templates("книга"):
+        #print(template.string)
+        argnames = [argument.name.lower().strip() for argument in template.arguments]
+        if "заглавие" in argnames:
+            template.name = "книга-ру"
+            if "назва" in argnames: # хтось чомусь не до кінця перекладає шаблон
+                print("warning: назва in argnames")
+            page.replace(span, template.string)
+
+
+def transform(text: str) -> tuple[str, Counter]:
+    """Книга with Russian arguments -> книга-ру; return the new text and changed templates per name."""
+    if not GATE.match(text):
+        return text, Counter()
+    page = PageModel(text)
+    fix(page)
+    return page.apply(), page.touched
+
 
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
@@ -34,30 +60,28 @@ class BasicBot(
         'summary': "[[Шаблон:Книга]] -> [[Шаблон:Книга-ру|Книга-ру]]",  # your own bot summary
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the page
+        'workers': 0,  # transform pages in this many processes
     }
 
+    def setup(self) -> None:
+        """Start counting changed templates and the transform workers."""
+        super().setup()
+        self.touched = Counter()
+        self.generator = GATE.filter(self.generator)
+        self.transforms = TransformPool(transform, self.opt.workers)
+        self.generator = self.transforms.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Stop the transform workers and report how many templates were changed."""
+        self.transforms.shutdown()
+        GATE.report()
+        print('Changed templates: ' + ', '.join(f'{name} {count}' for name, count in self.touched.most_common()))
+        super().teardown()
+
     def treat_page(self) -> None:
-        text = self.current_page.text
-
-        parsed = wtp.parse(text)
-        
-        templates = parsed.templates
-        
-        for template in templates:
-            if template.name.lower().strip() == "книга":
-                #print(template.string)
-                argnames = [argument.name.lower().strip() for argument in template.arguments]
-                for i in ["заглавие"]:
-                    if i in argnames:
-                        
-                        template_str = template.string
-                        template.name = "книга-ру"
-                        if "назва" in argnames: # хтось чомусь не до кінця перекладає шаблон
-                            print("warning: назва in argnames")
-                        
-                        text = text.replace(template_str, template.string)
-                        break
-                        
+        text, touched = self.transforms.result(self.current_page)
+        self.touched.update(touched)
+
         self.put_current(text, summary=self.opt.summary)
 
 
@@ -82,6 +106,8 @@ def main(*args: str) -> None:
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'workers':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Span-based edits of a page text, applied in one pass.
+
+Instead of calling text.replace() for every change, which copies and scans
+the whole text each time and may hit another occurrence of the same string,
+changes are recorded as (start, end, new text) against the original text and
+joined together once at the end.
+"""
+from __future__ import annotations
+
+import bisect
+
+
+class OverlappingEdit(ValueError):
+
+    """The edit touches a span already changed by another edit."""
+
+
+class SpanEdits:
+
+    """Edits of one text, kept sorted by position."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self._starts = []
+        self._edits = []  # (start, end, new), sorted by start
+
+    def replace(self, start: int, end: int, new: str) -> None:
+        """
+        Replace text[start:end] with new.
+
+        :raises OverlappingEdit: if the span overlaps an already recorded edit
+        """
+        if not 0 <= start <= end <= len(self.text):
+            raise ValueError(f'Invalid span ({start}, {end})')
+        i = bisect.bisect_left(self._starts, start)
+        if i > 0 and self._edits[i - 1][1] > start:
+            raise OverlappingEdit(f'({start}, {end}) overlaps {self._edits[i - 1][:2]}')
+        if i < len(self._edits) and (self._edits[i][0] < end or self._edits[i][0] == start):
+            raise OverlappingEdit(f'({start}, {end}) overlaps {self._edits[i][:2]}')
+        self._starts.insert(i, start)
+        self._edits.insert(i, (start, end, new))
+
+    def __len__(self) -> int:
+        return len(self._edits)
+
+    def apply(self) -> str:
+        """Return the text with all edits applied."""
+        parts = []
+        pos = 0
+        for start, end, new in self._edits:
+            parts.append(self.text[pos:start])
+            parts.append(new)
+            pos = end
+        parts.append(self.text[pos:])
+        return ''.join(parts)
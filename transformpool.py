@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Text transformations of the bots run in worker processes.
+
+Used by langjp.py, rubook.py, tracklist_fix.py, yar-prim.py, add_notelist.py
+and 2001.py with -workers:N. Their fixes are pure functions of the page text
+(transform), so while the bot saves one batch of preloaded pages, the next
+batch is already being parsed and transformed by N processes. The bot gets
+the pages in generator order and only asks and saves in the main process.
+Without -workers the transform runs inline, as before.
+"""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+def batches(iterable, size: int):
+    """Split an iterable into lists of up to size items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def transform_texts(transform, texts: list[str]) -> list:
+    """Run transform over a list of texts in a worker process."""
+    return [transform(text) for text in texts]
+
+
+class TransformPool:
+
+    """Run transform(page.text) ahead of the bot in a process pool."""
+
+    def __init__(self, transform, workers: int = 0, batch: int = 50) -> None:
+        self.transform = transform
+        self.workers = workers
+        self.batch = batch
+        self._pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._results = {}  # id(page): (text, result) of the current batch
+
+    def wrap(self, pages):
+        """Yield the pages of the generator, transforming the next batch in background."""
+        if self._pool is None:
+            yield from pages
+            return
+        chunk_size = max(1, self.batch // self.workers)
+        pending = deque()
+        for batch in batches(pages, self.batch):
+            texts = [page.text for page in batch]
+            futures = [self._pool.submit(transform_texts, self.transform, chunk)
+                       for chunk in batches(texts, chunk_size)]
+            pending.append((batch, texts, futures))
+            if len(pending) > 1:
+                yield from self._drain(*pending.popleft())
+        while pending:
+            yield from self._drain(*pending.popleft())
+
+    def _drain(self, batch, texts, futures):
+        results = [result for future in futures for result in future.result()]
+        self._results = {id(page): (text, result) for page, text, result in zip(batch, texts, results)}
+        for page in batch:
+            yield page
+
+    def result(self, page):
+        """Return transform(page.text), computing it now if the page was not done ahead."""
+        text = page.text
+        stored = self._results.pop(id(page), None)
+        if stored is None or stored[0] != text:
+            return self.transform(text)
+        return stored[1]
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
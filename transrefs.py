@@ -13,6 +13,12 @@ import wikitextparser as wtp
 import re
 import difflib
 
+from dumprefs import RefIndex
+from prefetch import Prefetcher
+from refcache import RefCache, load_named_refs
+from refscan import extract_named_refs, get_ref_tags
+from reviewqueue import ReviewQueue, accepted_entries, apply_entries
+
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
@@ -37,15 +43,73 @@ class BasicBot(
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the 
         'tlang': 'en',
+        'refcache': 'refcache.sqlite',  # cache of foreign refs; empty to disable
+        'refcache_size': 100,  # cache size limit, MB
+        'refindex': '',  # offline index of refs built by dumprefs.py
+        'collect': '',  # write candidates to this review queue instead of asking
+        'apply': '',  # save the substitutions accepted in this review queue
+        'prefetch': 0,  # prepare this many next pages in background
     }
 
-    def treat_page(self) -> None:
-        """Load the given page, do some changes, and save it."""
-        text = self.current_page.text
-        summary = self.opt.summary
+    ref_cache = None
+    ref_index = None
+    queue = None
+
+    def setup(self) -> None:
+        """Open the foreign refs cache and the review queue."""
+        super().setup()
+        if self.opt.refcache:
+            self.ref_cache = RefCache(self.opt.refcache, self.opt.refcache_size * 2**20)
+        if self.opt.refindex:
+            self.ref_index = RefIndex(self.opt.refindex)
+        if self.opt.collect:
+            self.queue = ReviewQueue(self.opt.collect)
+        if self.opt.apply:
+            self.reviewed = accepted_entries(self.opt.apply)
+        else:
+            self.prefetcher = Prefetcher(self.prepare_page, self.opt.prefetch)
+            self.generator = self.prefetcher.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Stop the background workers and close the foreign refs cache."""
+        if not self.opt.apply:
+            self.prefetcher.shutdown()
+        if self.ref_cache is not None:
+            self.ref_cache.close()
+        if self.ref_index is not None:
+            self.ref_index.close()
+        if self.queue is not None:
+            self.queue.close()
+            print(f'{self.queue.count} candidates written to {self.opt.collect}')
+        super().teardown()
+
+    def apply_reviewed(self) -> None:
+        """Save the substitutions accepted for the current page."""
+        entries = self.reviewed.get(self.current_page.title(), [])
+        if not entries:
+            return
+        if self.current_page.latest_revision_id != entries[0]['revid']:
+            print(f'{self.current_page.title()} changed since collection, skipping')
+            return
+        text, applied = apply_entries(self.current_page.text, entries)
+        if not applied:
+            print(f'{self.current_page.title()}: no accepted target left in the text, skipping')
+            return
+        self.put_current(text, summary=self.opt.summary)
+
+    def prepare_page(self, page):
+        """
+        Find the empty refs of the page and the refs of its en/ru versions.
+
+        Runs in background with -prefetch, so it must not ask anything.
+
+        :return: (empty_tags, [(lang, title, named refs)]), or None if the
+            page is exempt
+        """
+        text = page.text
 
         parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
+        tags = get_ref_tags(text)
         tags_dict = {} # only ref tags
         empty_tags = {} # all tags; name (str): stringified tag/template (str)
 
@@ -82,55 +146,73 @@ class BasicBot(
                     empty_tags[name] = str(template)
                     #print("added to empty")
 
+        foreign = []
+        if len(empty_tags):
+            # language links come preloaded together with the page text
+            langlinks = sorted(page.langlinks(), key=lambda link: link.site.lang)
+            for iterlink in langlinks:
+                if iterlink.site.family.name != "wikipedia":
+                    continue
+                if iterlink.site.lang in ["en", "ru"]:
+                    iterlink_page = pywikibot.Page(iterlink)
+                    try:
+                        iterlink_dict = load_named_refs(iterlink_page, extract_named_refs, self.ref_cache, self.ref_index)
+                    except pywikibot.exceptions.NoPageError:
+                        continue
+                    foreign.append((iterlink.site.lang, iterlink_page.title(), iterlink_dict))
+
+        return empty_tags, foreign
+
+    def treat_page(self) -> None:
+        """Load the given page, do some changes, and save it."""
+        if self.opt.apply:
+            self.apply_reviewed()
+            return
+        text = self.current_page.text
+        summary = self.opt.summary
+
+        prepared = self.prefetcher.result(self.current_page)
+        if prepared is None:
+            return None # don't do anything if the page is exempt
+        empty_tags, foreign = prepared
+
         if len(empty_tags):
             print(empty_tags)
+            if not foreign:
+                print("No interwiki pages are linked.")
             tags_replaced = 0
             stop_search = False
-            try:
-                item = pywikibot.ItemPage.fromPage(self.current_page)
-                for iterlink in item.iterlinks():
-                    if stop_search:
-                        break
-                    if iterlink.site.family.name != "wikipedia":
-                        continue
-                    if iterlink.site.lang in ["en", "ru"]:
-                        print(f'Looking through {iterlink.site.lang}')
-                        iterlink_page = pywikibot.Page(iterlink)
-                        iterlink_text = iterlink_page.text
-                        iterlink_parsed = wtp.parse(iterlink_text)
-                        iterlink_tags = iterlink_parsed.get_tags(name="ref")
-
-                        iterlink_dict = {}
-                        for tag in iterlink_tags:
-                            if "name" in tag.attrs:
-                                if len(tag.contents) == 0:
-                                    continue
-                                iterlink_dict[tag.attrs["name"]] = tag
-                        
-                        for key, value in iterlink_dict.items():
-                            
-                            if key in empty_tags:
-                                print(f'Found content for {key}: {value}')
-                                print("Press y to accept replacement, n to decline, s to stop search")
-
-                                while True:
-                                    press_y = input().lower()
-                                    if press_y == "y":
-                                        tags_replaced += 1
-                                        new_ref = value.string
-                                        text = text.replace(empty_tags[key], new_ref, 1)
-                                        break
-                                    if press_y == "n":
-                                        break
-                                    if press_y == "s":
-                                        stop_search = True
-                                        break
-                                        
-                            if tags_replaced == len(empty_tags): stop_search = True
-
-            except pywikibot.exceptions.NoPageError:
-                print("No page found; Likely no interwiki pages are linked.")
+            for lang, title, iterlink_dict in foreign:
+                if stop_search:
+                    break
+                print(f'Looking through {lang}')
+                
+                for key, value in iterlink_dict.items():
+                    
+                    if key in empty_tags and self.queue is not None:
+                        self.queue.add(self.current_page, key, empty_tags[key], value,
+                                       {'lang': lang, 'title': title})
+                    elif key in empty_tags:
+                        print(f'Found content for {key}: {value}')
+                        print("Press y to accept replacement, n to decline, s to stop search")
+
+                        while True:
+                            press_y = input().lower()
+                            if press_y == "y":
+                                tags_replaced += 1
+                                new_ref = value
+                                text = text.replace(empty_tags[key], new_ref, 1)
+                                break
+                            if press_y == "n":
+                                break
+                            if press_y == "s":
+                                stop_search = True
+                                break
+                                
+                    if tags_replaced == len(empty_tags): stop_search = True
 
+        if self.queue is not None:
+            return  # nothing is saved in the collect phase
         self.put_current(text, summary=summary)
 
 
@@ -158,21 +240,28 @@ def main(*args: str) -> None:
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text', 'tlang'):
+        if option in ('summary', 'text', 'tlang', 'refcache', 'refindex', 'collect', 'apply'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option in ('refcache_size', 'prefetch'):
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
             options[option] = True
 
-    # The preloading option is responsible for downloading multiple
-    # pages from the wiki simultaneously.
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    gen = gen_factory.getCombinedGenerator()
+    if options.get('apply'):
+        # the pages come from the review queue; decisions are already made
+        gen = (pywikibot.Page(gen_factory.site, title) for title in accepted_entries(options['apply']))
+        options['always'] = True
 
     # check if further help is needed
     if not pywikibot.bot.suggest_help(missing_generator=not gen):
+        # Download pages from the wiki in batches of 50 together with their
+        # language links, so that treat_page needs no Wikidata request.
+        gen = gen_factory.site.preloadpages(gen, groupsize=50, langlinks=not options.get('apply'))
         # pass generator and private options to the bot
         bot = BasicBot(generator=gen, **options)
         bot.run()  # guess what it does
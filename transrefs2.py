@@ -12,12 +12,56 @@ from pywikibot.bot import (
 import wikitextparser as wtp
 import re
 import difflib
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from dumprefs import RefIndex
+from refcache import RefCache, load_named_refs
+from refscan import extract_named_refs, get_ref_tags
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
+class LangStats:
+
+    """
+    Per-language statistics of finding missing refs, kept between runs.
+
+    For every language it stores how many pages were searched there and on
+    how many of them at least one missing ref was found.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.stats = {}  # lang: [searched, found]
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.stats = json.load(f)
+
+    def hit_rate(self, lang: str) -> float:
+        """Estimated probability of finding a missing ref in this language."""
+        searched, found = self.stats.get(lang, (0, 0))
+        return (found + 1) / (searched + 2)  # Laplace smoothing for new languages
+
+    def record(self, lang: str, found: bool) -> None:
+        searched, hits = self.stats.get(lang, (0, 0))
+        self.stats[lang] = [searched + 1, hits + found]
+
+    def order(self, sitelinks, hints=()):
+        """Sort sitelinks: hinted languages first, then by hit rate."""
+        return sorted(sitelinks, key=lambda link: (link.site.lang not in hints,
+                                                   -self.hit_rate(link.site.lang)))
+
+    def save(self) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
@@ -37,15 +81,91 @@ class BasicBot(
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the 
         'tlang': 'en',
+        'workers': 0,  # fetch sitelinks concurrently with this many threads
+        'refcache': 'refcache.sqlite',  # cache of foreign refs; empty to disable
+        'refcache_size': 100,  # cache size limit, MB
+        'refindex': '',  # offline index of refs built by dumprefs.py
+        'langstats': 'langstats.json',  # per-language hit statistics
+        'maxlangs': 0,  # search at most this many languages per page; 0 - all
     }
 
+    _fetch_pool = None
+    ref_cache = None
+    ref_index = None
+
+    def setup(self) -> None:
+        """Open the foreign refs cache."""
+        super().setup()
+        if self.opt.refcache:
+            self.ref_cache = RefCache(self.opt.refcache, self.opt.refcache_size * 2**20)
+        if self.opt.refindex:
+            self.ref_index = RefIndex(self.opt.refindex)
+        self.lang_stats = LangStats(self.opt.langstats)
+
+    def iter_foreign_refs(self, sitelinks):
+        """Yield (lang, named refs) for each sitelink, one after another."""
+        for iterlink in sitelinks:
+            page = pywikibot.Page(iterlink)
+            yield iterlink.site.lang, load_named_refs(page, extract_named_refs, self.ref_cache, self.ref_index)
+
+    def iter_foreign_refs_concurrent(self, sitelinks):
+        """
+        Yield (lang, named refs) for each sitelink, in the order of sitelinks.
+
+        Pages are fetched and parsed by a bounded thread pool; the ref scan
+        is cheaper than sending the text to another process. At most `workers` sitelinks are fetched ahead of the one being
+        yielded, so the order from LangStats.order() is kept: the most
+        promising wikis are asked about first, and stopping early wastes at
+        most `workers` fetches. Pending work is cancelled when the generator
+        is closed.
+        """
+        if self._fetch_pool is None:
+            self._fetch_pool = ThreadPoolExecutor(max_workers=self.opt.workers)
+
+        def fetch_and_parse(iterlink):
+            return load_named_refs(pywikibot.Page(iterlink), extract_named_refs, self.ref_cache, self.ref_index)
+
+        sitelinks = iter(sitelinks)
+        pending = deque()
+
+        def submit(count):
+            for iterlink in islice(sitelinks, count):
+                pending.append((iterlink, self._fetch_pool.submit(fetch_and_parse, iterlink)))
+
+        submit(self.opt.workers)
+        try:
+            while pending:
+                iterlink, future = pending.popleft()
+                submit(1)
+                lang = iterlink.site.lang
+                try:
+                    refs = future.result()
+                except pywikibot.exceptions.Error as e:
+                    print(f'Skipping {lang}: {e}')
+                    continue
+                yield lang, refs
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def teardown(self) -> None:
+        """Shut down the fetch pool and close the refs cache."""
+        if self._fetch_pool is not None:
+            self._fetch_pool.shutdown(wait=True, cancel_futures=True)
+        if self.ref_cache is not None:
+            self.ref_cache.close()
+        if self.ref_index is not None:
+            self.ref_index.close()
+        self.lang_stats.save()
+        super().teardown()
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
         text = self.current_page.text
         summary = self.opt.summary
 
         parsed = wtp.parse(text)
-        tags = parsed.get_tags(name="ref")
+        tags = get_ref_tags(text)
         tags_dict = {} # only ref tags
         empty_tags = {} # all tags; name (str): stringified tag/template (str)
 
@@ -72,8 +192,11 @@ class BasicBot(
         r_templates = parsed.templates
         
         empty_rs = {}
+        hints = [] # languages named in {{Перекладено}}
         for template in r_templates:
             if template.name.strip().lower() == 'bots' or template.name.strip().lower() == 'nobots': return None # don't do anything if the page is exempt
+            if template.name.strip().lower() == 'перекладено' and template.arguments:
+                hints.append(template.arguments[0].value.strip().lower())
             if template.name.strip().lower() == 'r' and template.arguments:
                 #print("R: " + template.string)
                 name = template.arguments[0].value
@@ -89,45 +212,45 @@ class BasicBot(
             stop_search = False
             try:
                 item = pywikibot.ItemPage.fromPage(self.current_page)
-                for iterlink in item.iterlinks():
-                    if stop_search:
-                        break
-                    if iterlink.site.family.name != "wikipedia":
-                        continue
-                    #if iterlink.site.lang in ["en", "ru"]:
-                    print(f'Looking through {iterlink.site.lang}')
-                    iterlink_page = pywikibot.Page(iterlink)
-                    iterlink_text = iterlink_page.text
-                    iterlink_parsed = wtp.parse(iterlink_text)
-                    iterlink_tags = iterlink_parsed.get_tags(name="ref")
-
-                    iterlink_dict = {}
-                    for tag in iterlink_tags:
-                        if "name" in tag.attrs:
-                            if len(tag.contents) == 0:
-                                continue
-                            iterlink_dict[tag.attrs["name"]] = tag
-                    
-                    for key, value in iterlink_dict.items():
+                sitelinks = [iterlink for iterlink in item.iterlinks()
+                             if iterlink.site.family.name == "wikipedia" and iterlink.site != self.site]
+                # most promising languages first, so the search can stop early
+                sitelinks = self.lang_stats.order(sitelinks, hints)
+                if self.opt.maxlangs:
+                    sitelinks = sitelinks[:self.opt.maxlangs]
+                if self.opt.workers > 0:
+                    foreign_refs = self.iter_foreign_refs_concurrent(sitelinks)
+                else:
+                    foreign_refs = self.iter_foreign_refs(sitelinks)
+                try:
+                    for lang, iterlink_dict in foreign_refs:
+                        if stop_search:
+                            break
+                        print(f'Looking through {lang}')
+                        self.lang_stats.record(lang, any(key in empty_tags for key in iterlink_dict))
+
+                        for key, value in iterlink_dict.items():
                         
-                        if key in empty_tags:
-                            print(f'Found content for {key}: {value}')
-                            print("Press y to accept replacement, n to decline, s to stop search")
-
-                            while True:
-                                press_y = input().lower()
-                                if press_y == "y":
-                                    tags_replaced += 1
-                                    new_ref = value.string
-                                    text = text.replace(empty_tags[key], new_ref, 1)
-                                    break
-                                if press_y == "n":
-                                    break
-                                if press_y == "s":
-                                    stop_search = True
-                                    break
+                            if key in empty_tags:
+                                print(f'Found content for {key}: {value}')
+                                print("Press y to accept replacement, n to decline, s to stop search")
+
+                                while True:
+                                    press_y = input().lower()
+                                    if press_y == "y":
+                                        tags_replaced += 1
+                                        new_ref = value
+                                        text = text.replace(empty_tags[key], new_ref, 1)
+                                        break
+                                    if press_y == "n":
+                                        break
+                                    if press_y == "s":
+                                        stop_search = True
+                                        break
                                     
-                        if tags_replaced == len(empty_tags): stop_search = True
+                            if tags_replaced == len(empty_tags): stop_search = True
+                finally:
+                    foreign_refs.close()
 
             except pywikibot.exceptions.NoPageError:
                 print("No page found; Likely no interwiki pages are linked.")
@@ -159,10 +282,12 @@ def main(*args: str) -> None:
     for arg in local_args:
         arg, _, value = arg.partition(':')
         option = arg[1:]
-        if option in ('summary', 'text', 'tlang'):
+        if option in ('summary', 'text', 'tlang', 'refcache', 'refindex', 'langstats'):
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option in ('workers', 'refcache_size', 'maxlangs'):
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else:
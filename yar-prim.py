@@ -10,12 +10,21 @@ from pywikibot.bot import (
     SingleSiteBot,
 )
 import re
+from collections import Counter
+
+from transformpool import TransformPool
 
 # This is required for the text that is shown when you run this script
 # with the parameter -help.
 docuReplacements = {'&params;': pagegenerators.parameterHelp}  # noqa: N816
 
 
+def transform(text: str) -> tuple[str, Counter]:
+    """Remove {{ЯР-прим|...}} lines; return the new text and the number removed."""
+    text, count = re.subn(r"{{ЯР-прим\|.+?}}\n", "", text)
+    return text, Counter({"ЯР-прим": count} if count else {})
+
+
 class BasicBot(
     # Refer pywikobot.bot for generic bot classes
     SingleSiteBot,  # A bot only working on one site
@@ -35,15 +44,25 @@ class BasicBot(
         'text': 'Test',  # add this text from option. 'Test' is default
         'top': False,  # append text on top of the 
         'tlang': 'en',
+        'workers': 0,  # transform pages in this many processes
     }
 
+    def setup(self) -> None:
+        """Start the transform workers."""
+        super().setup()
+        self.transforms = TransformPool(transform, self.opt.workers)
+        self.generator = self.transforms.wrap(self.generator)
+
+    def teardown(self) -> None:
+        """Stop the transform workers."""
+        self.transforms.shutdown()
+        super().teardown()
+
     def treat_page(self) -> None:
         """Load the given page, do some changes, and save it."""
-        text = self.current_page.text
+        text, _ = self.transforms.result(self.current_page)
         summary = self.opt.summary
         
-        text = re.sub("{{ЯР-прим\|.+?}}\n", "", text)
-        
         # if summary option is None, it takes the default i18n summary from
         # i18n subdirectory with summary_key as summary key.
         self.put_current(text, summary=summary)
@@ -77,6 +96,8 @@ def main(*args: str) -> None:
             if not value:
                 pywikibot.input('Please enter a value for ' + arg)
             options[option] = value
+        elif option == 'workers':
+            options[option] = int(value or pywikibot.input('Please enter a value for ' + arg))
         # take the remaining options as booleans.
         # You will get a hint if they aren't pre-defined in your bot class
         else: